@@ -0,0 +1,337 @@
+"""
+Benchmark do pipeline do GÊNESIS com extratos bancários sintéticos.
+
+Gera extratos em PDF com o fpdf a partir de lançamentos conhecidos (datas, históricos
+e valores C/D), opcionalmente "digitalizados" com ruído, inclinação e desfoque, e os
+processa com o pipeline completo (extração, mapeamento, Excel e TXT), sem rede.
+Ao final informa páginas/s, pico de memória, tempo por etapa e a precisão por campo
+em relação ao gabarito.
+
+Uso:
+    python benchmarks/extratos_sinteticos.py --documentos 5 --paginas 10 --modo digitalizado
+    python benchmarks/extratos_sinteticos.py --dpi 200 --preprocessamento endireitar,recortar --json resultado.json
+
+Requer o Poppler (pdf2image/pdftotext) e, para páginas digitalizadas, o Tesseract.
+"""
+import argparse
+import contextlib
+import difflib
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+import genesis  # noqa: E402
+
+# Históricos usados nos lançamentos (apenas letras, como o parser os devolve)
+HISTORICOS = [
+    "PIX RECEBIDO", "PIX ENVIADO", "TED RECEBIDA", "TED ENVIADA", "TARIFA BANCARIA",
+    "PAGAMENTO BOLETO", "DEPOSITO EM DINHEIRO", "RESGATE APLICACAO", "APLICACAO AUTOMATICA",
+    "DEBITO AUTOMATICO", "IOF", "JUROS CHEQUE ESPECIAL", "TRANSFERENCIA ENTRE CONTAS",
+    "PAGAMENTO FORNECEDOR", "RECEBIMENTO CARTAO",
+]
+
+# Linhas que aparecem nos extratos e devem ser ignoradas pelo parser
+CABECALHO = [
+    "BANCO SINTETICO S.A.                         EXTRATO DE CONTA CORRENTE",
+    "Agencia: 0001   Conta: 12345-6   Cliente: EMPRESA EXEMPLO LTDA",
+    "Data        Historico                          Nr.Doc         Valor",
+]
+RODAPE = "SAC 0800 000 0000 - Ouvidoria 0800 000 0001"
+
+
+def formatar_valor_brl(centavos):
+    """
+    Formata centavos no padrão 1.234,56.
+    """
+    return f"{centavos / 100:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+
+
+def gerar_lancamentos(rng, quantidade, inicio):
+    """
+    Gera `quantidade` lançamentos com data, histórico, número do documento e valor C/D.
+    """
+    lancamentos = []
+    dia = inicio
+    for _ in range(quantidade):
+        dia += timedelta(days=rng.random() < 0.3)
+        tipo = rng.choice("CD")
+        centavos = rng.choice([rng.randint(1, 9_999), rng.randint(10_000, 999_999), rng.randint(1_000_000, 99_999_999)])
+        lancamentos.append({
+            "data": dia.strftime("%d/%m/%Y"),
+            "historico": rng.choice(HISTORICOS),
+            "documento": str(rng.randint(1000, 999999)),
+            "valor": f"{formatar_valor_brl(centavos)}{tipo}",
+        })
+    return lancamentos
+
+
+def gerar_base_dados(caminho):
+    """
+    Gera a BASE DE DADOS.xlsx com um código para cada histórico e retorna o gabarito do mapeamento.
+    """
+    mapeamento = {}
+    for indice, historico in enumerate(HISTORICOS, start=1):
+        mapeamento[historico] = (100 + indice, 200 + indice, 300 + indice, f"H{indice:03d}")
+    base = genesis.pd.DataFrame(
+        [(historico, *codigos) for historico, codigos in mapeamento.items()],
+        columns=["Histórico", "Cód. Conta Debito", "Cód. Conta Credito", "Cód. Histórico", "Código"],
+    )
+    base.to_excel(caminho, index=False)
+    return mapeamento
+
+
+def gerar_pdf_digital(caminho, paginas):
+    """
+    Gera o extrato com camada de texto: uma lista de lançamentos por página.
+    """
+    from fpdf import FPDF
+
+    pdf = FPDF(format="A4")
+    pdf.set_auto_page_break(False)
+    for numero, lancamentos in enumerate(paginas, start=1):
+        pdf.add_page()
+        pdf.set_font("Courier", "B", 11)
+        for linha in CABECALHO:
+            pdf.cell(0, 6, linha, 0, 1)
+        pdf.ln(4)
+        pdf.set_font("Courier", "", 10)
+        if numero == 1:
+            pdf.cell(0, 5, f"{lancamentos[0]['data']}  SALDO ANTERIOR                                       1.000,00 C", 0, 1)
+        for lancamento in lancamentos:
+            linha = (f"{lancamento['data']}  {lancamento['historico']:<34}{lancamento['documento']:>8}"
+                     f"  {lancamento['valor'][:-1]:>14} {lancamento['valor'][-1]}")
+            pdf.cell(0, 5, linha, 0, 1)
+        pdf.set_y(-20)
+        pdf.set_font("Courier", "", 8)
+        pdf.cell(0, 5, f"{RODAPE}     Pagina {numero}/{len(paginas)}", 0, 1)
+    pdf.output(caminho, "F")
+
+
+def digitalizar_pdf(origem, destino, rng, dpi, ruido, inclinacao):
+    """
+    Simula um extrato escaneado: rasteriza o PDF, aplica inclinação, desfoque, ruído e
+    compressão JPEG, e monta um novo PDF só com as imagens (sem camada de texto).
+    """
+    from fpdf import FPDF
+    from PIL import Image, ImageFilter
+
+    np = genesis.np
+    imagens = genesis.pdf2image.convert_from_path(origem, poppler_path=genesis.POPLER_PATH, dpi=dpi, grayscale=True)
+    pdf = FPDF(format="A4")
+    with tempfile.TemporaryDirectory() as temporario:
+        for numero, imagem in enumerate(imagens, start=1):
+            imagem = imagem.rotate(rng.uniform(-inclinacao, inclinacao), resample=Image.BICUBIC, fillcolor=255)
+            imagem = imagem.filter(ImageFilter.GaussianBlur(radius=0.6))
+            matriz = np.asarray(imagem, dtype=np.float32)
+            matriz = matriz + np.random.default_rng(rng.randint(0, 2**32 - 1)).normal(0, ruido, matriz.shape)
+            imagem = Image.fromarray(np.clip(matriz, 0, 255).astype(np.uint8))
+            caminho_imagem = os.path.join(temporario, f"pagina_{numero}.jpg")
+            imagem.save(caminho_imagem, "JPEG", quality=75)
+            pdf.add_page()
+            pdf.image(caminho_imagem, 0, 0, 210, 297)
+        pdf.output(destino, "F")
+
+
+def gerar_documento(diretorio, indice, rng, args):
+    """
+    Gera um extrato sintético e retorna (caminho do PDF, gabarito dos lançamentos).
+    """
+    paginas = [gerar_lancamentos(rng, args.linhas, date(2024, 1, 1) + timedelta(days=30 * pagina))
+               for pagina in range(args.paginas)]
+    caminho_digital = os.path.join(diretorio, f"extrato_{indice:03d}.pdf")
+    gerar_pdf_digital(caminho_digital, paginas)
+
+    modo = args.modo
+    if modo == "misto":
+        modo = "digitalizado" if indice % 2 else "digital"
+    if modo == "digitalizado":
+        caminho = os.path.join(diretorio, f"extrato_{indice:03d}_digitalizado.pdf")
+        digitalizar_pdf(caminho_digital, caminho, rng, args.dpi_digitalizacao, args.ruido, args.inclinacao)
+        os.remove(caminho_digital)
+        caminho_digital = caminho
+    return caminho_digital, [lancamento for pagina in paginas for lancamento in pagina]
+
+
+def medir_precisao(df, gabarito, mapeamento):
+    """
+    Compara as linhas extraídas com o gabarito, alinhando-as pela sequência (data, valor).
+    Retorna os acertos por campo e a contagem de linhas.
+    """
+    extraidas = list(zip(df["Data Mov."], df["Histórico"], df["Valor"])) if not df.empty else []
+    chaves_extraidas = [(data, valor) for data, _, valor in extraidas]
+    chaves_gabarito = [(lancamento["data"], lancamento["valor"]) for lancamento in gabarito]
+
+    acertos = {"data": 0, "historico": 0, "valor": 0, "mapeamento": 0}
+    pares = difflib.SequenceMatcher(None, chaves_gabarito, chaves_extraidas, autojunk=False)
+    alinhadas = 0
+    for bloco in pares.get_matching_blocks():
+        for deslocamento in range(bloco.size):
+            lancamento = gabarito[bloco.a + deslocamento]
+            linha = bloco.b + deslocamento
+            data, historico, valor = extraidas[linha]
+            alinhadas += 1
+            acertos["data"] += data == lancamento["data"]
+            acertos["historico"] += historico == lancamento["historico"]
+            acertos["valor"] += valor == lancamento["valor"]
+            esperado = mapeamento[lancamento["historico"]]
+            obtido = df.iloc[linha][["Cód. Conta Debito", "Cód. Conta Credito", "Cód. Histórico"]].tolist()
+            acertos["mapeamento"] += obtido == list(esperado[:3])
+
+    return {"gabarito": len(gabarito), "extraidas": len(extraidas), "alinhadas": alinhadas, **acertos}
+
+
+def memoria_pico_mb():
+    """
+    Retorna o pico de memória residente (MB) do processo e dos processos filhos já encerrados.
+    """
+    try:
+        import resource
+        unidade = 1 if sys.platform == "darwin" else 1024  # ru_maxrss vem em bytes no macOS e em KB no Linux
+        proprio = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unidade
+        filhos = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * unidade
+        return {"processo": proprio / (1024 * 1024), "filhos": filhos / (1024 * 1024)}
+    except ImportError:
+        pass
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return {"processo": getattr(info, "peak_wset", info.rss) / (1024 * 1024), "filhos": None}
+    except ImportError:
+        return {"processo": None, "filhos": None}
+
+
+def configurar_genesis(args, diretorio):
+    """
+    Aplica ao módulo genesis as configurações escolhidas para a rodada.
+    """
+    genesis.OCR_DPI = args.dpi
+    genesis.OCR_DPI_ADAPTATIVO = args.dpi_adaptativo
+    genesis.CORRESPONDENCIA_APROXIMADA = args.aproximado
+    genesis.OCR_WORKERS = args.workers
+    genesis.USAR_CACHE_OCR = args.cache
+    genesis.CACHE_OCR_DIR = os.path.join(diretorio, "cache_ocr")
+    genesis.DIRETORIO_CACHE = os.path.join(diretorio, "cache")
+    genesis.CACHE_BASE_DADOS_PATH = os.path.join(diretorio, "cache", "base_dados.pkl")
+    genesis.USAR_CAMADA_TEXTO = not args.sem_camada_texto
+    if args.preprocessamento is not None:
+        genesis.ETAPAS_PREPROCESSAMENTO = tuple(e for e in args.preprocessamento.split(",") if e)
+    if args.motor:
+        genesis.MOTOR_OCR = args.motor
+
+
+def executar(args):
+    """
+    Gera os extratos, executa o pipeline em cada um e retorna o resumo da rodada.
+    """
+    rng = random.Random(args.semente)
+    with tempfile.TemporaryDirectory(prefix="genesis_bench_") as diretorio:
+        configurar_genesis(args, diretorio)
+        genesis.BASE_DADOS_PATH = os.path.join(diretorio, "BASE DE DADOS.xlsx")
+        mapeamento = gerar_base_dados(genesis.BASE_DADOS_PATH)
+        saida = os.path.join(diretorio, "saida")
+        os.makedirs(saida)
+
+        inicio = time.perf_counter()
+        documentos = [gerar_documento(diretorio, indice, rng, args) for indice in range(1, args.documentos + 1)]
+        tempo_geracao = time.perf_counter() - inicio
+
+        registros = []
+        extraidos = []
+        tempo_total = 0.0
+        for caminho_pdf, gabarito in documentos:
+            inicio = time.perf_counter()
+            df = genesis.extrair_dados_ocr(caminho_pdf, workers=args.workers)
+            tempo_total += time.perf_counter() - inicio
+            # O mapeamento altera o DataFrame: a precisão é medida sobre uma cópia, fora do tempo
+            extraidos.append((df.copy(), gabarito))
+
+            inicio = time.perf_counter()
+            # O exportador TXT informa cada arquivo salvo no console
+            with contextlib.redirect_stdout(io.StringIO()):
+                df = genesis.exportar_pdf(df, caminho_pdf, saida)
+            registros.append(genesis.finalizar_metricas(caminho_pdf, "vazio" if df.empty else "ok"))
+            tempo_total += time.perf_counter() - inicio
+        genesis.encerrar_pool_ocr()
+
+        totais = {}
+        for df, gabarito in extraidos:
+            for campo, valor in medir_precisao(df, gabarito, mapeamento).items():
+                totais[campo] = totais.get(campo, 0) + valor
+
+    paginas = args.documentos * args.paginas
+    gabarito = totais.get("gabarito", 0) or 1
+    return {
+        "configuracao": {
+            "documentos": args.documentos, "paginas": args.paginas, "linhas": args.linhas,
+            "modo": args.modo, "dpi": args.dpi, "dpi_adaptativo": args.dpi_adaptativo,
+            "aproximado": args.aproximado, "workers": args.workers, "cache": args.cache,
+            "camada_texto": not args.sem_camada_texto,
+            "preprocessamento": list(genesis.ETAPAS_PREPROCESSAMENTO), "motor": genesis.MOTOR_OCR,
+        },
+        "tempo_geracao_s": tempo_geracao,
+        "tempo_total_s": tempo_total,
+        "paginas_por_s": paginas / tempo_total if tempo_total else None,
+        "etapas_s": genesis.resumir_metricas(registros, tempo_total)["etapas_s"],
+        "memoria_pico_mb": memoria_pico_mb(),
+        "linhas": {campo: totais.get(campo, 0) for campo in ("gabarito", "extraidas", "alinhadas")},
+        "precisao": {campo: totais.get(campo, 0) / gabarito for campo in ("data", "historico", "valor", "mapeamento")},
+    }
+
+
+def imprimir_resumo(resultado):
+    configuracao = resultado["configuracao"]
+    print(f"Configuração: {json.dumps(configuracao, ensure_ascii=False)}")
+    print(f"Geração dos extratos: {resultado['tempo_geracao_s']:.1f} s")
+    print(f"Pipeline: {resultado['tempo_total_s']:.2f} s - {resultado['paginas_por_s']:.2f} páginas/s")
+    for etapa, duracao in resultado["etapas_s"].items():
+        print(f"  {etapa:<18}{duracao:8.2f} s")
+    memoria = resultado["memoria_pico_mb"]
+    if memoria["processo"] is not None:
+        filhos = f", filhos {memoria['filhos']:.0f} MB" if memoria["filhos"] is not None else ""
+        print(f"Pico de memória: processo {memoria['processo']:.0f} MB{filhos}")
+    linhas = resultado["linhas"]
+    print(f"Linhas: {linhas['extraidas']} extraídas, {linhas['alinhadas']}/{linhas['gabarito']} alinhadas ao gabarito")
+    print("Precisão por campo: " + ", ".join(f"{campo} {taxa:.1%}" for campo, taxa in resultado["precisao"].items()))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark do GÊNESIS com extratos sintéticos.")
+    parser.add_argument("--documentos", type=int, default=3)
+    parser.add_argument("--paginas", type=int, default=5, help="Páginas por documento")
+    parser.add_argument("--linhas", type=int, default=35, help="Lançamentos por página")
+    parser.add_argument("--modo", choices=["digital", "digitalizado", "misto"], default="digitalizado")
+    parser.add_argument("--dpi", type=int, default=genesis.OCR_DPI, help="DPI de renderização para o OCR")
+    parser.add_argument("--dpi-adaptativo", action="store_true",
+                        help="Usa o DPI adaptativo (baixa resolução primeiro, maior só se necessário)")
+    parser.add_argument("--aproximado", action="store_true",
+                        help="Ativa a correspondência aproximada dos históricos (trigramas)")
+    parser.add_argument("--dpi-digitalizacao", type=int, default=200, help="DPI das páginas 'escaneadas'")
+    parser.add_argument("--ruido", type=float, default=12.0, help="Desvio padrão do ruído gaussiano")
+    parser.add_argument("--inclinacao", type=float, default=1.5, help="Inclinação máxima, em graus")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--preprocessamento", default=None, help="Etapas OpenCV separadas por vírgula")
+    parser.add_argument("--motor", choices=["auto", "tesserocr", "pytesseract"], default=None)
+    parser.add_argument("--cache", action="store_true", help="Mantém o cache de OCR ativo")
+    parser.add_argument("--sem-camada-texto", action="store_true", help="Força OCR mesmo em PDFs digitais")
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--json", help="Grava o resultado completo neste arquivo")
+    args = parser.parse_args(argv)
+
+    resultado = executar(args)
+    imprimir_resumo(resultado)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
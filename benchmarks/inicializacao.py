@@ -0,0 +1,74 @@
+"""
+Benchmark do tempo de inicialização do GÊNESIS.
+
+Importa o módulo `genesis` em processos novos, mede o tempo de cada importação e
+falha (código de saída 1) se a mediana passar do limite ou se alguma dependência
+pesada for carregada durante a importação.
+
+Uso:
+    python benchmarks/inicializacao.py [--repeticoes 10] [--limite 0.3]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Módulos que não podem ser importados junto com o genesis
+MODULOS_PESADOS = [
+    "cv2", "numpy", "pandas", "pdf2image", "pytesseract", "PIL", "requests",
+    "fpdf", "customtkinter", "tkinter", "tkinterdnd2", "openpyxl", "pyarrow",
+]
+
+SCRIPT = """
+import json, sys, time
+inicio = time.perf_counter()
+import genesis
+duracao = time.perf_counter() - inicio
+pesados = [m for m in {pesados!r} if m in sys.modules]
+print(json.dumps({{"duracao": duracao, "pesados": pesados}}))
+"""
+
+def medir_importacao():
+    """
+    Importa o genesis em um interpretador novo e retorna (duração, módulos pesados carregados).
+    """
+    resultado = subprocess.run(
+        [sys.executable, "-c", SCRIPT.format(pesados=MODULOS_PESADOS)],
+        cwd=RAIZ, capture_output=True, text=True, check=True,
+    )
+    dados = json.loads(resultado.stdout.strip().splitlines()[-1])
+    return dados["duracao"], dados["pesados"]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mede o tempo de importação do genesis.")
+    parser.add_argument("--repeticoes", type=int, default=10)
+    parser.add_argument("--limite", type=float, default=0.3, help="Mediana máxima aceita, em segundos")
+    args = parser.parse_args(argv)
+
+    duracoes = []
+    pesados = set()
+    for _ in range(args.repeticoes):
+        duracao, carregados = medir_importacao()
+        duracoes.append(duracao)
+        pesados.update(carregados)
+
+    mediana = statistics.median(duracoes)
+    print(f"Importação do genesis: mediana {mediana * 1000:.1f} ms, "
+          f"mínimo {min(duracoes) * 1000:.1f} ms, máximo {max(duracoes) * 1000:.1f} ms "
+          f"({args.repeticoes} repetições)")
+
+    falhou = False
+    if pesados:
+        print(f"ERRO: dependências pesadas carregadas na importação: {', '.join(sorted(pesados))}")
+        falhou = True
+    if mediana > args.limite:
+        print(f"ERRO: mediana acima do limite de {args.limite * 1000:.0f} ms")
+        falhou = True
+    return 1 if falhou else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
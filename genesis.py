@@ -1,51 +1,464 @@
 import os
-import cv2
-import numpy as np
+import sys
+import time
+import shutil
+import argparse
+import atexit
+import importlib
 import logging
+import logging.handlers
+import multiprocessing
+import hashlib
+import json
+import pickle
+import sqlite3
+import socket
+import threading
+import subprocess
+import queue
+import itertools
+import heapq
+import contextlib
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 import zipfile
-import pandas as pd
-from tkinterdnd2 import TkinterDnD, DND_FILES
-from pdf2image import convert_from_path
-from pytesseract import image_to_string
-import customtkinter as ctk
-from tkinter import filedialog, messagebox
 import re
-from pytesseract import pytesseract
-import requests
-from PIL import Image
-from fpdf import FPDF
 
-# Caminhos dos binários
-TESSERACT_PATH = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
-POPLER_PATH = r"C:\poppler\bin"
+class ModuloTardio:
+    """
+    Importa o módulo somente no primeiro acesso a um de seus atributos.
+    """
+    def __init__(self, nome):
+        self._nome = nome
+        self._modulo = None
+
+    def __getattr__(self, atributo):
+        if self._modulo is None:
+            self._modulo = importlib.import_module(self._nome)
+        return getattr(self._modulo, atributo)
+
+# Dependências pesadas, importadas somente no primeiro uso para que a inicialização
+# seja rápida e o modo de linha de comando funcione em servidores sem Tk
+cv2 = ModuloTardio("cv2")
+np = ModuloTardio("numpy")
+pd = ModuloTardio("pandas")
+pdf2image = ModuloTardio("pdf2image")
+pytesseract = ModuloTardio("pytesseract")
+requests = ModuloTardio("requests")
+openpyxl = ModuloTardio("openpyxl")
+pa = ModuloTardio("pyarrow")
+pq = ModuloTardio("pyarrow.parquet")
+ds = ModuloTardio("pyarrow.dataset")
+Image = ModuloTardio("PIL.Image")
+
+# Módulos da interface gráfica
+ctk = ModuloTardio("customtkinter")
+filedialog = ModuloTardio("tkinter.filedialog")
+messagebox = ModuloTardio("tkinter.messagebox")
+
+# Caminhos dos binários (podem ser sobrescritos por variáveis de ambiente; fora do
+# Windows o padrão é usar os executáveis do PATH)
+if os.name == "nt":
+    TESSERACT_PATH = os.environ.get("GENESIS_TESSERACT_PATH", r"C:\Program Files\Tesseract-OCR\tesseract.exe")
+    POPLER_PATH = os.environ.get("GENESIS_POPPLER_PATH", r"C:\poppler\bin")
+else:
+    TESSERACT_PATH = os.environ.get("GENESIS_TESSERACT_PATH", "tesseract")
+    POPLER_PATH = os.environ.get("GENESIS_POPPLER_PATH") or None
 
 # URLs para download
 TESSERACT_URL = "https://digi.bib.uni-mannheim.de/tesseract/tesseract-ocr-w64-setup-v5.3.0.20221214.exe"
 POPPLER_URL = "https://github.com/oschwartz10612/poppler-windows/releases/download/v23.01.0/Release-23.01.0.zip"
 
 # Caminho da base de dados externa
-BASE_DADOS_PATH = r"C:\Users\NicolasAndré\Wedo Contabilidade e Solu&ccedil;&otilde;es Empresariais\W E D O - W E D O - DEPARTAMENTOS\T.I\Projetos Gênesis\Base_Data\BASE DE DADOS.xlsx"
+BASE_DADOS_PATH = os.environ.get("GENESIS_BASE_DADOS_PATH") or r"C:\Users\NicolasAndré\Wedo Contabilidade e Solu&ccedil;&otilde;es Empresariais\W E D O - W E D O - DEPARTAMENTOS\T.I\Projetos Gênesis\Base_Data\BASE DE DADOS.xlsx"
 
-# Teste de leitura do arquivo
-try:
-    base_dados = pd.read_excel(BASE_DADOS_PATH)
-    print(f"Base de dados carregada com sucesso. Contém {base_dados.shape[0]} linhas e {base_dados.shape[1]} colunas.")
-    print("Colunas presentes:", base_dados.columns)
+# Diretório local para dados compilados e caches (fora do compartilhamento de rede)
+DIRETORIO_CACHE = os.path.join(os.environ.get("LOCALAPPDATA") or os.path.expanduser("~"), "Genesis")
+CACHE_BASE_DADOS_PATH = os.path.join(DIRETORIO_CACHE, "base_dados.pkl")
 
-    # Validação das colunas necessárias
-    colunas_necessarias = ["Histórico", "Cód. Conta Debito", "Cód. Conta Credito", "Cód. Histórico"]
-    if not all(coluna in base_dados.columns for coluna in colunas_necessarias):
-        raise ValueError(f"A base de dados deve conter as colunas: {', '.join(colunas_necessarias)}")
+# Colunas obrigatórias da base e colunas devolvidas pelo índice, nesta ordem
+COLUNAS_NECESSARIAS = ["Histórico", "Cód. Conta Debito", "Cód. Conta Credito", "Cód. Histórico"]
+COLUNAS_INDICE = ["Cód. Conta Debito", "Cód. Conta Credito", "Cód. Histórico", "Código"]
 
-except FileNotFoundError:
-    print(f"Arquivo não encontrado: {BASE_DADOS_PATH}")
-except Exception as e:
-    print(f"Erro ao carregar a base de dados: {e}")
+_indice_base = None
+_lock_indice_base = threading.Lock()
 
-# Configuração de logs
-logging.basicConfig(filename="processamento.log", level=logging.INFO,
-                    format="%(asctime)s - %(levelname)s - %(message)s")
+def calcular_hash_arquivo(caminho, tamanho_bloco=1024 * 1024):
+    """
+    Calcula o SHA-256 do conteúdo de um arquivo.
+    """
+    hash_arquivo = hashlib.sha256()
+    with open(caminho, "rb") as f:
+        for bloco in iter(lambda: f.read(tamanho_bloco), b""):
+            hash_arquivo.update(bloco)
+    return hash_arquivo.hexdigest()
+
+def compilar_indice_base(base_dados):
+    """
+    Monta o índice normalizado Histórico -> (Débito, Crédito, Cód. Histórico, Código).
+    Em históricos repetidos prevalece a última linha, como no mapeamento original.
+    """
+    if not all(coluna in base_dados.columns for coluna in COLUNAS_NECESSARIAS):
+        raise ValueError(f"A base de dados deve conter as colunas: {', '.join(COLUNAS_NECESSARIAS)}")
+
+    # Normalizar os valores para evitar diferenças de capitalização ou espaços
+    historicos = base_dados["Histórico"].str.strip().str.upper()
+    colunas = [base_dados[coluna] if coluna in base_dados.columns else [None] * len(base_dados)
+               for coluna in COLUNAS_INDICE]
+
+    mapeamento = {}
+    for historico, *valores in zip(historicos, *colunas):
+        if isinstance(historico, str):
+            mapeamento[historico] = tuple(valores)
+
+    return {
+        "linhas": base_dados.shape[0],
+        "colunas": list(base_dados.columns),
+        "tem_codigo": "Código" in base_dados.columns,
+        "mapeamento": mapeamento,
+    }
+
+def _preparar_indice(indice):
+    """
+    Gera, a partir do índice, um dicionário de mapeamento por coluna para uso com Series.map.
+    """
+    indice["por_coluna"] = {
+        coluna: {historico: valores[posicao] for historico, valores in indice["mapeamento"].items()}
+        for posicao, coluna in enumerate(COLUNAS_INDICE)
+    }
+    return indice
+
+# Correspondência aproximada dos históricos que não estão na base, por um índice de
+# trigramas das chaves (desligada, apenas históricos idênticos são mapeados)
+CORRESPONDENCIA_APROXIMADA = os.environ.get("GENESIS_CORRESPONDENCIA_APROXIMADA") == "1"
+# Similaridade mínima (coeficiente de Dice dos trigramas, de 0 a 1) para aceitar um candidato
+SIMILARIDADE_MINIMA = 0.75
+# Vantagem mínima do melhor candidato sobre o segundo; abaixo dela a correspondência é ambígua
+MARGEM_MINIMA_CANDIDATOS = 0.05
+
+def trigramas(texto):
+    """
+    Retorna o conjunto de trigramas do texto, com espaços nas bordas para valorizar o início e o fim.
+    """
+    texto = f"  {' '.join(texto.split())} "
+    return {texto[posicao:posicao + 3] for posicao in range(len(texto) - 2)}
+
+class IndiceTrigramas:
+    """
+    Índice invertido trigrama -> chaves da base. Uma consulta só compara o texto com as
+    chaves que têm algum trigrama em comum, em vez de percorrer a base inteira.
+    """
+    def __init__(self, chaves):
+        self.chaves = list(chaves)
+        self.tamanhos = []
+        self.postagens = {}
+        for posicao, chave in enumerate(self.chaves):
+            gramas = trigramas(chave)
+            self.tamanhos.append(len(gramas))
+            for grama in gramas:
+                self.postagens.setdefault(grama, []).append(posicao)
+
+    def candidatos(self, texto, quantidade=2):
+        """
+        Retorna até `quantidade` pares (chave, similaridade), do mais ao menos parecido.
+        """
+        gramas = trigramas(texto)
+        comuns = {}
+        for grama in gramas:
+            for posicao in self.postagens.get(grama, ()):
+                comuns[posicao] = comuns.get(posicao, 0) + 1
+        melhores = heapq.nlargest(quantidade, comuns.items(),
+                                  key=lambda item: item[1] / (len(gramas) + self.tamanhos[item[0]]))
+        return [(self.chaves[posicao], 2 * quantidade_comum / (len(gramas) + self.tamanhos[posicao]))
+                for posicao, quantidade_comum in melhores]
+
+    def buscar(self, texto):
+        """
+        Retorna (chave, similaridade) do melhor candidato, ou None se ele não atingir
+        SIMILARIDADE_MINIMA ou não se destacar do segundo por MARGEM_MINIMA_CANDIDATOS.
+        """
+        candidatos = self.candidatos(texto)
+        if not candidatos or candidatos[0][1] < SIMILARIDADE_MINIMA:
+            return None
+        if len(candidatos) > 1 and candidatos[0][1] - candidatos[1][1] < MARGEM_MINIMA_CANDIDATOS:
+            return None
+        return candidatos[0]
+
+def obter_indice_trigramas(indice):
+    """
+    Retorna o índice de trigramas das chaves da base, montado no primeiro uso.
+    """
+    with _lock_indice_base:
+        if "trigramas" not in indice:
+            indice["trigramas"] = IndiceTrigramas(indice["mapeamento"].keys())
+        return indice["trigramas"]
+
+def _ler_indice_compilado():
+    """
+    Lê a cópia compilada do índice no disco local. Retorna None se não existir ou estiver corrompida.
+    """
+    try:
+        with open(CACHE_BASE_DADOS_PATH, "rb") as f:
+            return pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logging.warning(f"Cópia compilada da base de dados ignorada: {e}")
+        return None
+
+def _gravar_indice_compilado(indice):
+    """
+    Grava a cópia compilada do índice no disco local (escrita atômica).
+    """
+    try:
+        os.makedirs(DIRETORIO_CACHE, exist_ok=True)
+        temporario = f"{CACHE_BASE_DADOS_PATH}.{os.getpid()}.tmp"
+        dados = {chave: valor for chave, valor in indice.items() if chave != "por_coluna"}
+        with open(temporario, "wb") as f:
+            pickle.dump(dados, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporario, CACHE_BASE_DADOS_PATH)
+    except Exception as e:
+        logging.warning(f"Não foi possível gravar a cópia compilada da base de dados: {e}")
+
+def carregar_indice_base():
+    """
+    Retorna o índice da base de dados, lendo o Excel somente quando o arquivo mudou.
+    A validade é conferida pelo mtime/tamanho do arquivo; se eles mudarem, o hash do
+    conteúdo decide se a cópia compilada local ainda pode ser usada.
+    """
+    global _indice_base
+    with _lock_indice_base:
+        stat = os.stat(BASE_DADOS_PATH)
+        assinatura = (stat.st_mtime_ns, stat.st_size)
+        if (_indice_base is not None and _indice_base["caminho"] == BASE_DADOS_PATH
+                and _indice_base["assinatura"] == assinatura):
+            return _indice_base
+
+        compilado = _ler_indice_compilado()
+        if compilado is not None and compilado.get("caminho") != BASE_DADOS_PATH:
+            compilado = None
+
+        if compilado is not None and compilado["assinatura"] != assinatura:
+            hash_atual = calcular_hash_arquivo(BASE_DADOS_PATH)
+            if compilado["hash"] == hash_atual:
+                compilado["assinatura"] = assinatura
+                _gravar_indice_compilado(compilado)
+            else:
+                compilado = None
+        else:
+            hash_atual = None
+
+        if compilado is None:
+            base_dados = pd.read_excel(BASE_DADOS_PATH)
+            compilado = compilar_indice_base(base_dados)
+            compilado["caminho"] = BASE_DADOS_PATH
+            compilado["assinatura"] = assinatura
+            compilado["hash"] = hash_atual or calcular_hash_arquivo(BASE_DADOS_PATH)
+            _gravar_indice_compilado(compilado)
+            logging.info(f"Base de dados lida e compilada: {BASE_DADOS_PATH}")
+
+        _indice_base = _preparar_indice(compilado)
+        return _indice_base
+
+def validar_base_dados():
+    """
+    Carrega a base de dados pelo índice em cache e informa se ela está utilizável.
+    Chamada pelos pontos de entrada, e não na importação do módulo.
+    """
+    try:
+        indice_base = carregar_indice_base()
+        print(f"Base de dados carregada com sucesso. Contém {indice_base['linhas']} linhas e {len(indice_base['colunas'])} colunas.")
+        print("Colunas presentes:", indice_base["colunas"])
+        return True
+
+    except FileNotFoundError:
+        print(f"Arquivo não encontrado: {BASE_DADOS_PATH}")
+    except Exception as e:
+        print(f"Erro ao carregar a base de dados: {e}")
+    return False
+
+_ouvinte_logs = None
+_fila_logs = None
+
+def configurar_logs():
+    """
+    Configuração de logs (chamada pelos pontos de entrada).
+    As mensagens entram em uma fila e são gravadas no arquivo por uma thread própria,
+    para que o processamento não fique esperando a escrita em disco. A fila é do
+    multiprocessing: os processos do pool de OCR também registram nela.
+    """
+    global _ouvinte_logs, _fila_logs
+    raiz = logging.getLogger()
+    raiz.setLevel(logging.DEBUG if RASTREAMENTO else logging.INFO)
+    if _ouvinte_logs is not None:
+        return
+
+    arquivo = logging.FileHandler("processamento.log")
+    arquivo.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
+    _fila_logs = multiprocessing.Queue()
+    raiz.addHandler(logging.handlers.QueueHandler(_fila_logs))
+    _ouvinte_logs = logging.handlers.QueueListener(_fila_logs, arquivo)
+    _ouvinte_logs.start()
+    atexit.register(_ouvinte_logs.stop)  # Grava as mensagens que ainda estiverem na fila
+
+# Rastreamento de depuração (amostras dos DataFrames, mapeamentos). Desligado, as
+# mensagens nem chegam a ser montadas: cada ponto de rastreio é protegido por um `if`
+RASTREAMENTO = os.environ.get("GENESIS_RASTREAMENTO") == "1"
+
+# Arquivo JSON lines que recebe as métricas de cada documento e o resumo de cada lote
+# (None desativa a gravação; as métricas continuam disponíveis em memória)
+METRICAS_PATH = os.environ.get("GENESIS_METRICAS_PATH")
+
+# Memória de cada etapa: pico alocado pelo processo principal durante a etapa, acima do
+# que já estava alocado no início dela (tracemalloc; inclui os arrays do numpy, mas não
+# os processos do pool de OCR). O tracemalloc encarece todas as alocações, por isso a
+# medição fica desligada por padrão
+MEDIR_MEMORIA = os.environ.get("GENESIS_MEDIR_MEMORIA") == "1"
+
+def iniciar_medicao_memoria():
+    """
+    Zera o pico do tracemalloc e retorna o total alocado no início da etapa
+    (None com a medição desligada).
+    """
+    if not MEDIR_MEMORIA:
+        return None
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    return tracemalloc.get_traced_memory()[0]
+
+def pico_memoria_mb(inicio):
+    """
+    Retorna, em MB, o pico alocado desde iniciar_medicao_memoria acima do total inicial.
+    Com documentos processados ao mesmo tempo (interface gráfica), o pico é o do
+    processo durante a etapa.
+    """
+    return max(tracemalloc.get_traced_memory()[1] - inicio, 0) / (1024 * 1024)
+
+class MetricasDocumento:
+    """
+    Tempo por etapa, contadores e memória (com MEDIR_MEMORIA) do processamento de um documento.
+    Etapas executadas nos processos do pool de OCR somam o tempo de cada página,
+    por isso podem passar da duração total do documento.
+    """
+    def __init__(self, documento):
+        self.documento = documento
+        self.inicio = time.time()
+        self._relogio = time.perf_counter()
+        self.etapas = {}
+        self.contadores = {}
+        self.memoria_mb = {}
+        self.paginas = {}
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def etapa(self, nome):
+        """
+        Mede o tempo de um trecho e, com MEDIR_MEMORIA, o pico de memória alocada nele.
+        """
+        memoria_inicial = iniciar_medicao_memoria()
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.adicionar_tempo(nome, time.perf_counter() - inicio)
+            if memoria_inicial is not None:
+                memoria = pico_memoria_mb(memoria_inicial)
+                with self._lock:
+                    self.memoria_mb[nome] = max(memoria, self.memoria_mb.get(nome, 0.0))
+
+    def adicionar_tempo(self, nome, segundos):
+        with self._lock:
+            self.etapas[nome] = self.etapas.get(nome, 0.0) + segundos
+
+    def contar(self, nome, quantidade=1):
+        with self._lock:
+            self.contadores[nome] = self.contadores.get(nome, 0) + quantidade
+
+    def detalhar_pagina(self, numero, **dados):
+        """
+        Guarda informações de uma página específica (fonte do texto, DPI usado no OCR...).
+        """
+        with self._lock:
+            self.paginas.setdefault(numero, {}).update(dados)
+
+    def registro(self, status):
+        """
+        Retorna as métricas do documento como um dicionário serializável em JSON.
+        """
+        with self._lock:
+            registro = {
+                "tipo": "documento",
+                "documento": self.documento,
+                "status": status,
+                "inicio": datetime.fromtimestamp(self.inicio).isoformat(timespec="seconds"),
+                "duracao_s": round(time.perf_counter() - self._relogio, 4),
+                "etapas_s": {nome: round(segundos, 4) for nome, segundos in self.etapas.items()},
+                "contadores": dict(self.contadores),
+                "memoria_mb": {nome: round(mb, 1) for nome, mb in self.memoria_mb.items()},
+            }
+            if self.paginas:
+                registro["paginas"] = {str(numero): dados for numero, dados in sorted(self.paginas.items())}
+            return registro
+
+_metricas_documentos = {}
+_lock_metricas = threading.Lock()
+
+def metricas_documento(documento):
+    """
+    Retorna as métricas em andamento do documento, criando-as no primeiro uso.
+    """
+    with _lock_metricas:
+        metricas = _metricas_documentos.get(documento)
+        if metricas is None:
+            metricas = _metricas_documentos[documento] = MetricasDocumento(documento)
+        return metricas
+
+def gravar_metricas(registro):
+    """
+    Acrescenta um registro ao arquivo JSON lines de métricas, se configurado.
+    """
+    if not METRICAS_PATH:
+        return
+    with _lock_metricas:
+        with open(METRICAS_PATH, "a", encoding="utf-8") as arquivo:
+            arquivo.write(json.dumps(registro, ensure_ascii=False) + "\n")
+
+def finalizar_metricas(documento, status="ok"):
+    """
+    Encerra as métricas do documento, grava o registro e o retorna.
+    """
+    with _lock_metricas:
+        metricas = _metricas_documentos.pop(documento, None)
+    if metricas is None:
+        return None
+    registro = metricas.registro(status)
+    gravar_metricas(registro)
+    logging.info(f"Métricas de {documento}: {registro['duracao_s']:.2f} s, etapas {registro['etapas_s']}")
+    return registro
+
+def resumir_metricas(registros, duracao=None):
+    """
+    Consolida os registros dos documentos de um lote: totais por etapa e contador,
+    páginas por segundo e maior pico de memória de uma etapa (com MEDIR_MEMORIA).
+    """
+    resumo = {"tipo": "resumo", "documentos": len(registros), "falhas": 0,
+              "etapas_s": {}, "contadores": {}, "memoria_pico_mb": None}
+    for registro in registros:
+        resumo["falhas"] += registro["status"] != "ok"
+        for nome, segundos in registro["etapas_s"].items():
+            resumo["etapas_s"][nome] = round(resumo["etapas_s"].get(nome, 0.0) + segundos, 4)
+        for nome, quantidade in registro["contadores"].items():
+            resumo["contadores"][nome] = resumo["contadores"].get(nome, 0) + quantidade
+        for mb in registro["memoria_mb"].values():
+            resumo["memoria_pico_mb"] = max(mb, resumo["memoria_pico_mb"] or 0.0)
+    if duracao is None:
+        duracao = sum(registro["duracao_s"] for registro in registros)
+    resumo["duracao_s"] = round(duracao, 4)
+    paginas = resumo["contadores"].get("paginas", 0)
+    resumo["paginas_por_s"] = round(paginas / duracao, 3) if duracao else None
+    return resumo
 
 def verificar_e_instalar_tesseract():
     """
@@ -90,9 +503,6 @@ def baixar_arquivo(url, destino):
     else:
         raise Exception(f"Falha ao baixar o arquivo de {url} (status {resposta.status_code}).")
 
-# Configuração do Tesseract
-pytesseract.tesseract_cmd = TESSERACT_PATH
-
 def is_gray(rgb):
     """
     Verifica se a cor é cinza.
@@ -100,65 +510,969 @@ def is_gray(rgb):
     r, g, b = rgb
     return r == g == b
 
-def extrair_dados_ocr(caminho_pdf):
+# Número de processos usados no OCR das páginas (1 = modo serial)
+OCR_WORKERS = max(1, (os.cpu_count() or 1) - 1)
+
+# Resolução de renderização e quantidade de páginas renderizadas por vez no modo serial
+OCR_DPI = 300
+JANELA_PAGINAS = 1
+
+# DPI adaptativo: cada página é lida primeiro na menor resolução da lista e só é
+# renderizada e lida de novo na seguinte quando a confiança média das palavras ou a
+# fração de linhas reconhecidas pelo padrão ficar abaixo do mínimo. Desligado, todas
+# as páginas usam OCR_DPI.
+OCR_DPI_ADAPTATIVO = os.environ.get("GENESIS_DPI_ADAPTATIVO") == "1"
+OCR_DPIS_ADAPTATIVOS = (150, 300)
+CONFIANCA_MINIMA_OCR = 80.0
+TAXA_MINIMA_LINHAS = 0.5
+
+# Configurações do Tesseract
+OCR_LANG = "por"
+OCR_CONFIG = "--psm 6"
+
+# Motor de OCR: "tesserocr" mantém a API do Tesseract carregada no processo (o idioma é
+# lido uma única vez e o motor é reaproveitado entre páginas e PDFs); "pytesseract"
+# executa um processo do tesseract por página; "auto" usa o tesserocr se estiver instalado
+MOTOR_OCR = os.environ.get("GENESIS_MOTOR_OCR", "auto")
+
+# Cache em disco do texto de OCR por página (limite em bytes, com descarte LRU).
+# GENESIS_CACHE_OCR=0 desativa o cache; GENESIS_CACHE_OCR_DIR muda o diretório
+USAR_CACHE_OCR = os.environ.get("GENESIS_CACHE_OCR") != "0"
+CACHE_OCR_DIR = os.environ.get("GENESIS_CACHE_OCR_DIR") or os.path.join(DIRETORIO_CACHE, "ocr")
+CACHE_OCR_LIMITE_BYTES = 512 * 1024 * 1024
+# Versão do conteúdo do cache, incluída na chave de cada página: deve ser incrementada
+# quando o formato das entradas ou o resultado do OCR para a mesma imagem e as mesmas
+# configurações mudar (pré-processamento, remontagem do texto...), para que o cache
+# não devolva textos antigos
+VERSAO_CACHE_OCR = 1
+
+# Etapas de pré-processamento OpenCV aplicadas antes do OCR, na ordem informada:
+# "endireitar" (corrige a inclinação), "binarizar" (Otsu) e "recortar" (mantém só a
+# região das linhas de lançamento; endireita a página antes, se "endireitar" não vier
+# antes dele). Vazio desativa o pré-processamento.
+ETAPAS_PREPROCESSAMENTO = ()
+# Maior inclinação corrigida, em graus, e passo da busca do ângulo
+ANGULO_MAXIMO_INCLINACAO = 5.0
+PASSO_INCLINACAO = 0.25
+# Mínimo de linhas alinhadas para reconhecer a tabela de lançamentos
+MIN_LINHAS_TABELA = 3
+
+# Usa a camada de texto dos PDFs digitais e faz OCR apenas nas páginas digitalizadas
+USAR_CAMADA_TEXTO = True
+# Mínimo de caracteres visíveis para considerar a camada de texto de uma página utilizável
+MIN_CARACTERES_TEXTO = 20
+
+# Regex ajustada para ignorar o campo 'Nr.Doc'
+PADRAO_LINHA = re.compile(
+    r"(\d{2}/\d{2}/\d{4})\s+(.*?)\s+([\d.]+,\d{2}\s?[CD]?)"
+)
+
+_pool_ocr = None
+_pool_ocr_chave = None
+_lock_pool_ocr = threading.Lock()
+
+# Configurações repassadas aos processos do pool (no Windows eles não herdam
+# alterações feitas em tempo de execução, como as opções da linha de comando)
+CONFIGURACOES_OCR = [
+    "TESSERACT_PATH", "POPLER_PATH", "OCR_DPI", "OCR_LANG", "OCR_CONFIG", "MOTOR_OCR",
+    "OCR_DPI_ADAPTATIVO", "OCR_DPIS_ADAPTATIVOS", "CONFIANCA_MINIMA_OCR", "TAXA_MINIMA_LINHAS",
+    "USAR_CACHE_OCR", "CACHE_OCR_DIR", "CACHE_OCR_LIMITE_BYTES",
+    "ETAPAS_PREPROCESSAMENTO", "ANGULO_MAXIMO_INCLINACAO", "PASSO_INCLINACAO", "MIN_LINHAS_TABELA",
+]
+
+def configuracao_ocr():
     """
-    Extrai os dados do PDF utilizando OCR, incluindo colunas padrão.
+    Retorna os valores atuais das configurações usadas nos processos do pool.
     """
-    try:
-        imagens = convert_from_path(caminho_pdf, poppler_path=POPLER_PATH, dpi=300)
-        linhas_relevantes = []
+    return {nome: globals()[nome] for nome in CONFIGURACOES_OCR}
+
+def _inicializar_processo_ocr(configuracao, fila_logs=None, nivel_logs=logging.INFO):
+    """
+    Aplica no processo do pool as configurações do processo principal e envia os logs
+    do processo para a fila de configurar_logs (substituindo os handlers herdados no fork).
+    """
+    globals().update(configuracao)
+    if fila_logs is not None:
+        raiz = logging.getLogger()
+        for handler in raiz.handlers[:]:
+            raiz.removeHandler(handler)
+        raiz.addHandler(logging.handlers.QueueHandler(fila_logs))
+        raiz.setLevel(nivel_logs)
+
+class ProcessamentoCancelado(Exception):
+    """
+    Sinaliza que o processamento foi cancelado pelo usuário.
+    """
+
+def obter_pool_ocr(workers=None):
+    """
+    Retorna o pool de processos compartilhado do OCR, criando-o na primeira chamada
+    (ou recriando-o se o número de workers ou as configurações do OCR mudaram).
+    """
+    global _pool_ocr, _pool_ocr_chave
+    workers = workers or OCR_WORKERS
+    configuracao = configuracao_ocr()
+    chave = (workers, repr(sorted(configuracao.items())))
+    with _lock_pool_ocr:
+        if _pool_ocr is None or _pool_ocr_chave != chave:
+            if _pool_ocr is not None:
+                _pool_ocr.shutdown(wait=True)
+            _pool_ocr = ProcessPoolExecutor(max_workers=workers, initializer=_inicializar_processo_ocr,
+                                            initargs=(configuracao, _fila_logs, logging.getLogger().level))
+            _pool_ocr_chave = chave
+        return _pool_ocr
+
+def encerrar_pool_ocr():
+    """
+    Encerra o pool de processos do OCR, se existir.
+    """
+    global _pool_ocr, _pool_ocr_chave
+    with _lock_pool_ocr:
+        if _pool_ocr is not None:
+            _pool_ocr.shutdown(wait=True, cancel_futures=True)
+            _pool_ocr = None
+            _pool_ocr_chave = None
+
+def contar_paginas(caminho_pdf):
+    """
+    Retorna o número de páginas do PDF.
+    """
+    return pdf2image.pdfinfo_from_path(caminho_pdf, poppler_path=POPLER_PATH)["Pages"]
+
+def renderizar_paginas(caminho_pdf, primeira, ultima, dpi=None):
+    """
+    Renderiza o intervalo de páginas informado já em escala de cinza (por padrão em OCR_DPI).
+    """
+    return pdf2image.convert_from_path(caminho_pdf, poppler_path=POPLER_PATH, dpi=dpi or OCR_DPI,
+                                       first_page=primeira, last_page=ultima, grayscale=True)
+
+def iterar_paginas(caminho_pdf, paginas=None, janela=None, dpi=None):
+    """
+    Gera (numero_pagina, imagem) renderizando no máximo `janela` páginas por vez,
+    para que o consumo de memória não dependa do tamanho do documento.
+    Com `paginas`, renderiza apenas as páginas informadas (em ordem crescente).
+    """
+    janela = janela or JANELA_PAGINAS
+    if paginas is None:
+        paginas = range(1, contar_paginas(caminho_pdf) + 1)
+
+    # Agrupa as páginas em blocos consecutivos de até `janela` páginas
+    blocos = []
+    for numero in paginas:
+        if blocos and numero == blocos[-1][1] + 1 and numero - blocos[-1][0] < janela:
+            blocos[-1][1] = numero
+        else:
+            blocos.append([numero, numero])
+
+    for primeira, ultima in blocos:
+        imagens = renderizar_paginas(caminho_pdf, primeira, ultima, dpi)
+        for deslocamento in range(len(imagens)):
+            # Entrega a imagem e descarta a referência antes de seguir para a próxima
+            imagem, imagens[deslocamento] = imagens[deslocamento], None
+            yield primeira + deslocamento, imagem
+            del imagem
+
+def caminho_poppler(executavel):
+    """
+    Retorna o caminho de um executável do Poppler.
+    """
+    return os.path.join(POPLER_PATH, executavel) if POPLER_PATH else executavel
+
+def normalizar_texto_camada(texto):
+    """
+    Compacta os espaços do texto extraído com -layout, linha a linha, e descarta linhas vazias.
+    """
+    linhas = (re.sub(r"[ \t]+", " ", linha).strip() for linha in texto.split("\n"))
+    return "\n".join(linha for linha in linhas if linha)
 
-        # Regex ajustada para ignorar o campo 'Nr.Doc'
-        padrao_linha = re.compile(
-            r"(\d{2}/\d{2}/\d{4})\s+(.*?)\s+([\d.]+,\d{2}\s?[CD]?)"
+def extrair_camada_texto(caminho_pdf, total_paginas):
+    """
+    Extrai a camada de texto embutida com o pdftotext do Poppler.
+    Retorna {numero_pagina: texto} apenas para as páginas com texto utilizável: pelo
+    menos um lançamento reconhecido pelo parser de linhas. As demais (digitalizadas, ou com
+    só um carimbo ou cabeçalho na camada de texto) seguem para o OCR.
+    """
+    try:
+        resultado = subprocess.run(
+            [caminho_poppler("pdftotext"), "-layout", "-enc", "UTF-8", caminho_pdf, "-"],
+            capture_output=True, check=True,
+            creationflags=subprocess.CREATE_NO_WINDOW if os.name == "nt" else 0,
         )
+    except Exception as e:
+        logging.warning(f"Camada de texto indisponível para {caminho_pdf}, usando OCR: {e}")
+        return {}
+
+    # O pdftotext separa as páginas com form feed
+    paginas = resultado.stdout.decode("utf-8", errors="replace").split("\f")[:total_paginas]
+    camada = {}
+    for numero, texto in enumerate(paginas, start=1):
+        if len(re.sub(r"\s", "", texto)) < MIN_CARACTERES_TEXTO:
+            continue
+        texto = normalizar_texto_camada(texto)
+        if extrair_linhas_texto(texto)[0]:
+            camada[numero] = texto
+        else:
+            logging.info(f"{caminho_pdf}: página {numero} tem camada de texto sem lançamentos, usando OCR.")
+    return camada
 
-        for imagem in imagens:
-            imagem = imagem.convert('L')  # Converter para escala de cinza
-            texto = image_to_string(imagem, lang="por", config="--psm 6")
-            texto = re.sub(r"\s{2,}", " ", texto)
+class CacheOCR:
+    """
+    Cache em disco do texto de OCR, endereçado pelo hash da imagem da página e das
+    configurações do OCR. Cada entrada é um arquivo JSON com o texto e a confiança da
+    leitura (usada pelo DPI adaptativo); o mtime marca o último acesso.
+    O tamanho total só é levantado no disco quando a estimativa (total da última
+    varredura mais o que foi gravado desde então) ultrapassa o limite.
+    """
+    def __init__(self, diretorio, limite_bytes):
+        self.diretorio = diretorio
+        self.limite_bytes = limite_bytes
+        self._total = None  # Tamanho na última varredura (None: ainda não varrido neste processo)
+        self._gravados = 0
 
-            for linha in texto.split("\n"):
-                linha = linha.strip()
-                match = padrao_linha.search(linha)
-                if match:
-                    data_mov = match.group(1)
-                    historico = re.sub(r"[^a-zA-Z\s]", "", match.group(2)).strip()
-                    valor = match.group(3).replace(" ", "")
-                    linhas_relevantes.append([data_mov, historico, valor])
-                else:
-                    logging.warning(f"Linha ignorada (não corresponde ao padrão): {linha}")
+    def chave(self, imagem, dpi=None):
+        """
+        Calcula a chave da página a partir dos pixels e das configurações do OCR
+        (incluindo o pré-processamento, que é aplicado depois da consulta ao cache).
+        """
+        hash_pagina = hashlib.sha256()
+        configuracao = (f"v{VERSAO_CACHE_OCR}|{OCR_LANG}|{OCR_CONFIG}|{dpi or OCR_DPI}|{MOTOR_OCR}|{','.join(ETAPAS_PREPROCESSAMENTO)}"
+                        f"|{'adaptativo' if OCR_DPI_ADAPTATIVO else ''}")
+        hash_pagina.update(f"{configuracao}|{imagem.mode}|{imagem.size}".encode())
+        hash_pagina.update(imagem.tobytes())
+        return hash_pagina.hexdigest()
 
-        # Criar DataFrame com os dados extraídos, incluindo colunas padrão
-        df = pd.DataFrame(linhas_relevantes, columns=["Data Mov.", "Histórico", "Valor"])
-        df["Cód. Conta Debito"] = None
-        df["Cód. Conta Credito"] = None
-        df["Cód. Histórico"] = None
+    def _caminho(self, chave):
+        return os.path.join(self.diretorio, chave[:2], f"{chave}.json")
 
-        # Remover linhas onde o campo "Histórico" contém "SALDO"
-        df = df[~df["Histórico"].str.contains("SALDO", case=False, na=False)]
+    def obter(self, chave):
+        """
+        Retorna a entrada armazenada para a chave ({"texto", "confianca"}) ou None se não houver.
+        """
+        caminho = self._caminho(chave)
+        try:
+            with open(caminho, "r", encoding="utf-8") as f:
+                entrada = json.load(f)
+            os.utime(caminho)  # Marca o acesso para o descarte LRU
+            return entrada
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logging.warning(f"Falha ao ler o cache de OCR: {e}")
+            return None
+
+    def gravar(self, chave, texto, confianca=None):
+        """
+        Armazena o texto e a confiança da página (escrita atômica, segura entre processos).
+        Retorna o tamanho gravado em bytes (0 se a gravação falhar).
+        """
+        caminho = self._caminho(chave)
+        dados = json.dumps({"texto": texto, "confianca": confianca}, ensure_ascii=False).encode("utf-8")
+        try:
+            os.makedirs(os.path.dirname(caminho), exist_ok=True)
+            temporario = f"{caminho}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temporario, "wb") as f:
+                f.write(dados)
+            os.replace(temporario, caminho)
+            return len(dados)
+        except OSError as e:
+            logging.warning(f"Falha ao gravar o cache de OCR: {e}")
+            return 0
+
+    def registrar_gravacao(self, tamanho):
+        """
+        Soma à estimativa de tamanho os bytes gravados (inclusive pelos processos do pool).
+        """
+        self._gravados += tamanho
+
+    def aplicar_limite(self):
+        """
+        Remove as entradas acessadas há mais tempo quando o cache passa do limite de
+        tamanho, deixando-o em 90% do limite para que a varredura não se repita a cada
+        documento. Enquanto a estimativa couber no limite, o disco não é varrido.
+        """
+        if self._total is not None and self._total + self._gravados <= self.limite_bytes:
+            return
+        entradas = []
+        total = 0
+        try:
+            for subdiretorio in os.scandir(self.diretorio):
+                if not subdiretorio.is_dir():
+                    continue
+                for entrada in os.scandir(subdiretorio.path):
+                    if entrada.name.endswith(".json"):
+                        stat = entrada.stat()
+                        entradas.append((stat.st_mtime, stat.st_size, entrada.path))
+                        total += stat.st_size
+        except FileNotFoundError:
+            pass
+
+        if total > self.limite_bytes:
+            alvo = self.limite_bytes * 0.9
+            entradas.sort()
+            for _, tamanho, caminho in entradas:
+                if total <= alvo:
+                    break
+                try:
+                    os.remove(caminho)
+                    total -= tamanho
+                except OSError:
+                    pass
+        self._total = total
+        self._gravados = 0
+
+_cache_ocr = None
+
+def obter_cache_ocr():
+    """
+    Retorna o cache de OCR do processo atual, ou None se estiver desativado.
+    """
+    global _cache_ocr
+    if not USAR_CACHE_OCR:
+        return None
+    if _cache_ocr is None or _cache_ocr.diretorio != CACHE_OCR_DIR:
+        _cache_ocr = CacheOCR(CACHE_OCR_DIR, CACHE_OCR_LIMITE_BYTES)
+    return _cache_ocr
+
+def _mascara_tinta(matriz):
+    """
+    Retorna a máscara binária dos pixels escuros (texto = 255) pelo método de Otsu.
+    """
+    _, tinta = cv2.threshold(matriz, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    return tinta
 
-        # Remover linhas onde o campo "Valor" é igual a 0
-        df = df[df["Valor"] != 0]
+def endireitar_imagem(matriz):
+    """
+    Corrige a inclinação da página buscando o ângulo que deixa as linhas de texto
+    mais horizontais (maior variância do perfil de projeção horizontal).
+    """
+    tinta = cv2.resize(_mascara_tinta(matriz), None, fx=0.25, fy=0.25, interpolation=cv2.INTER_AREA)
+    altura, largura = tinta.shape
+    centro = (largura / 2, altura / 2)
+
+    melhor_angulo, melhor_variancia = 0.0, -1.0
+    for angulo in np.arange(-ANGULO_MAXIMO_INCLINACAO, ANGULO_MAXIMO_INCLINACAO + 1e-9, PASSO_INCLINACAO):
+        rotacao = cv2.getRotationMatrix2D(centro, float(angulo), 1.0)
+        girada = cv2.warpAffine(tinta, rotacao, (largura, altura), flags=cv2.INTER_NEAREST)
+        variancia = float(np.var(girada.sum(axis=1, dtype=np.float64)))
+        if variancia > melhor_variancia:
+            melhor_angulo, melhor_variancia = float(angulo), variancia
+
+    if abs(melhor_angulo) < PASSO_INCLINACAO / 2:
+        return matriz
+    altura, largura = matriz.shape
+    rotacao = cv2.getRotationMatrix2D((largura / 2, altura / 2), melhor_angulo, 1.0)
+    return cv2.warpAffine(matriz, rotacao, (largura, altura), flags=cv2.INTER_CUBIC,
+                          borderMode=cv2.BORDER_CONSTANT, borderValue=255)
+
+def binarizar_imagem(matriz):
+    """
+    Converte a página para preto e branco pelo método de Otsu.
+    """
+    _, binaria = cv2.threshold(matriz, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    return binaria
 
+def localizar_tabela(matriz):
+    """
+    Localiza a região das linhas de lançamento: as datas de cada linha formam uma coluna
+    de blocos de mesma largura alinhados à esquerda, em intervalos regulares.
+    Retorna (x0, y0, x1, y1), ou None se a coluna não for encontrada ou parecer duvidosa
+    (nesse caso a página inteira vai para o OCR).
+    """
+    tinta = _mascara_tinta(matriz)
+    altura, largura = tinta.shape
+
+    # Altura típica de um caractere, pela mediana dos componentes conectados
+    _, _, estatisticas, _ = cv2.connectedComponentsWithStats(tinta)
+    alturas = estatisticas[1:, cv2.CC_STAT_HEIGHT][estatisticas[1:, cv2.CC_STAT_AREA] > 4]
+    if len(alturas) == 0:
+        return None
+    altura_letra = max(int(np.median(alturas)), 1)
+
+    # Junta as letras de cada palavra em um único bloco
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (max(altura_letra // 2, 1), 1))
+    contornos, _ = cv2.findContours(cv2.dilate(tinta, kernel), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    palavras = [cv2.boundingRect(contorno) for contorno in contornos]
+    palavras = np.array([(x, y, w, h) for x, y, w, h in palavras if 0.6 * altura_letra <= h <= 2.0 * altura_letra])
+    if len(palavras) < MIN_LINHAS_TABELA:
+        return None
+
+    # Coluna de datas: o maior grupo de palavras com a margem esquerda próxima (tolerância
+    # de uma altura de letra, e não faixas fixas, que separam a coluna de uma página
+    # levemente inclinada) e a mesma largura
+    x, y, w, h = palavras.T
+    vizinhas = ((np.abs(x[:, None] - x[None, :]) <= altura_letra)
+                & (np.abs(w[:, None] - w[None, :]) <= 0.15 * w[:, None]))
+    datas = palavras[vizinhas[int(np.argmax(vizinhas.sum(axis=1)))]]
+    if len(datas) < MIN_LINHAS_TABELA:
+        return None
+
+    # Separa a coluna em sequências de linhas com espaçamento regular: palavras soltas de
+    # cabeçalho ou rodapé ficam em sequências curtas e são descartadas. Se sobrar mais de
+    # uma sequência (tabela dividida em blocos), o recorte é duvidoso
+    datas = datas[np.argsort(datas[:, 1])]
+    saltos = np.diff(datas[:, 1])
+    espacamento = max(float(np.median(saltos)), altura_letra)
+    sequencias = np.split(datas, np.flatnonzero(saltos > 3 * espacamento) + 1)
+    sequencias = [sequencia for sequencia in sequencias if len(sequencia) >= MIN_LINHAS_TABELA]
+    if len(sequencias) != 1:
+        return None
+    datas = sequencias[0]
+
+    margem = altura_letra
+    y0 = max(int(datas[:, 1].min()) - margem, 0)
+    y1 = min(int((datas[:, 1] + datas[:, 3]).max()) + margem, altura)
+    linhas = palavras[(y + h / 2 >= y0) & (y + h / 2 <= y1)]
+    x0 = max(int(linhas[:, 0].min()) - margem, 0)
+    x1 = min(int((linhas[:, 0] + linhas[:, 2]).max()) + margem, largura)
+    return x0, y0, x1, y1
+
+def recortar_tabela(matriz):
+    """
+    Recorta a página na região das linhas de lançamento; sem tabela reconhecida, mantém a página.
+    Espera a página já endireitada: inclinada, as linhas das bordas da tabela saem do recorte.
+    """
+    regiao = localizar_tabela(matriz)
+    if regiao is None:
+        return matriz
+    x0, y0, x1, y1 = regiao
+    return matriz[y0:y1, x0:x1]
+
+ETAPAS_OPENCV = {
+    "endireitar": endireitar_imagem,
+    "binarizar": binarizar_imagem,
+    "recortar": recortar_tabela,
+}
+
+def preprocessar_imagem(imagem, etapas=None):
+    """
+    Aplica as etapas de pré-processamento OpenCV a uma página em escala de cinza.
+    Retorna (imagem, pixels antes, pixels enviados ao OCR).
+    """
+    etapas = ETAPAS_PREPROCESSAMENTO if etapas is None else etapas
+    matriz = np.asarray(imagem)
+    pixels_antes = matriz.size
+    for posicao, etapa in enumerate(etapas):
+        if etapa not in ETAPAS_OPENCV:
+            raise ValueError(f"Etapa de pré-processamento desconhecida: {etapa}")
+        if etapa == "recortar" and "endireitar" not in etapas[:posicao]:
+            matriz = endireitar_imagem(matriz)
+        matriz = ETAPAS_OPENCV[etapa](matriz)
+    return Image.fromarray(np.ascontiguousarray(matriz)), pixels_antes, matriz.size
+
+class MotorPytesseract:
+    """
+    Motor de OCR original: um processo do tesseract por página, via pytesseract.
+    """
+    nome = "pytesseract"
 
-        # Adicionar colunas personalizadas
-        df = adicionar_colunas_personalizadas(df)
+    def _configuracao(self, dpi):
+        pytesseract.pytesseract.tesseract_cmd = TESSERACT_PATH  # Configuração do Tesseract
+        return f"{OCR_CONFIG} --dpi {dpi}" if dpi else OCR_CONFIG
 
-        return df
-    
-        # Log do conteúdo extraído
-        logging.info(f"Dados extraídos do PDF {caminho_pdf}: {df.head()}")
+    def reconhecer(self, imagem, dpi=None):
+        return pytesseract.image_to_string(imagem, lang=OCR_LANG, config=self._configuracao(dpi))
 
-        return df
-    
+    def reconhecer_com_confianca(self, imagem, dpi=None):
+        """
+        Lê a página com image_to_data e retorna (texto, confiança média das palavras).
+        O texto é remontado linha a linha a partir das palavras reconhecidas.
+        """
+        dados = pytesseract.image_to_data(imagem, lang=OCR_LANG, config=self._configuracao(dpi),
+                                          output_type=pytesseract.Output.DICT)
+        linhas = {}
+        confiancas = []
+        for palavra, confianca, bloco, paragrafo, linha in zip(
+                dados["text"], dados["conf"], dados["block_num"], dados["par_num"], dados["line_num"]):
+            if not str(palavra).strip():
+                continue
+            linhas.setdefault((bloco, paragrafo, linha), []).append(str(palavra))
+            if float(confianca) >= 0:
+                confiancas.append(float(confianca))
+        texto = "\n".join(" ".join(palavras) for palavras in linhas.values())
+        return texto, (sum(confiancas) / len(confiancas) if confiancas else None)
+
+    def fechar(self):
+        pass
+
+class MotorTesserocr:
+    """
+    Motor de OCR de longa duração: mantém uma instância da API do Tesseract (tesserocr)
+    com o idioma já carregado e a reutiliza a cada página.
+    """
+    nome = "tesserocr"
+
+    def __init__(self):
+        tesserocr = importlib.import_module("tesserocr")
+        opcoes = {"lang": OCR_LANG}
+        psm = re.search(r"--psm\s+(\d+)", OCR_CONFIG)
+        if psm:
+            opcoes["psm"] = int(psm.group(1))
+        if os.name == "nt":
+            opcoes["path"] = os.path.join(os.path.dirname(TESSERACT_PATH), "tessdata")
+        self._api = tesserocr.PyTessBaseAPI(**opcoes)
+
+    def reconhecer(self, imagem, dpi=None):
+        self._api.SetImage(imagem)
+        self._api.SetSourceResolution(dpi or OCR_DPI)
+        return self._api.GetUTF8Text()
+
+    def reconhecer_com_confianca(self, imagem, dpi=None):
+        """
+        Retorna (texto, confiança média das palavras), aproveitando o mesmo reconhecimento.
+        """
+        texto = self.reconhecer(imagem, dpi)
+        confiancas = self._api.AllWordConfidences()
+        return texto, (sum(confiancas) / len(confiancas) if confiancas else None)
+
+    def fechar(self):
+        self._api.End()
+
+def criar_motor_ocr():
+    """
+    Cria um motor de OCR conforme MOTOR_OCR, caindo para o pytesseract no modo "auto".
+    """
+    if MOTOR_OCR == "pytesseract":
+        return MotorPytesseract()
+    if MOTOR_OCR not in ("auto", "tesserocr"):
+        raise ValueError(f"Motor de OCR desconhecido: {MOTOR_OCR}")
+    try:
+        return MotorTesserocr()
     except Exception as e:
-        logging.error(f"Erro ao processar PDF com OCR: {e}")
-        return pd.DataFrame()
+        if MOTOR_OCR == "tesserocr":
+            raise
+        logging.info(f"tesserocr indisponível, usando pytesseract: {e}")
+        return MotorPytesseract()
+
+class PoolMotoresOCR:
+    """
+    Pool de motores de OCR de longa duração do processo atual. Cada motor atende uma
+    página por vez; os motores livres são reaproveitados entre páginas e PDFs.
+    """
+    def __init__(self, fabrica=criar_motor_ocr):
+        self._fabrica = fabrica
+        self._livres = queue.LifoQueue()
+        self._motores = []
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def motor(self):
+        try:
+            motor = self._livres.get_nowait()
+        except queue.Empty:
+            motor = self._fabrica()
+            with self._lock:
+                self._motores.append(motor)
+        try:
+            yield motor
+        finally:
+            self._livres.put(motor)
+
+    def fechar(self):
+        with self._lock:
+            for motor in self._motores:
+                motor.fechar()
+            self._motores.clear()
+        self._livres = queue.LifoQueue()
+
+_pool_motores = None
+_pool_motores_chave = None
+_lock_pool_motores = threading.Lock()
+
+def obter_pool_motores():
+    """
+    Retorna o pool de motores de OCR do processo, recriando-o se as configurações mudarem.
+    """
+    global _pool_motores, _pool_motores_chave
+    chave = (MOTOR_OCR, OCR_LANG, OCR_CONFIG, TESSERACT_PATH)
+    with _lock_pool_motores:
+        if _pool_motores is None or _pool_motores_chave != chave:
+            if _pool_motores is not None:
+                _pool_motores.fechar()
+            _pool_motores = PoolMotoresOCR()
+            _pool_motores_chave = chave
+        return _pool_motores
+
+def ocr_imagem(imagem, dpi=None, confianca=False):
+    """
+    Executa o pré-processamento e o OCR em uma imagem de página já renderizada em `dpi`.
+    Páginas idênticas já lidas antes são atendidas pelo cache de OCR.
+    Com `confianca`, também mede a confiança média das palavras (guardada no cache com o texto).
+    Retorna um dicionário com o texto e as estatísticas da página.
+    """
+    if imagem.mode != "L":
+        imagem = imagem.convert('L')  # Converter para escala de cinza
+
+    pagina = {"texto": None, "fonte": "ocr", "pixels_antes": 0, "pixels_ocr": 0,
+              "tempo_preprocessamento": 0.0, "tempo_ocr": 0.0, "dpi": dpi or OCR_DPI, "confianca": None}
+    cache = obter_cache_ocr()
+    if cache is not None:
+        chave = cache.chave(imagem, dpi)
+        entrada = cache.obter(chave)
+        if entrada is not None:
+            # A confiança guardada faz o DPI adaptativo decidir como na primeira leitura
+            pagina.update(texto=entrada["texto"], confianca=entrada["confianca"], fonte="cache")
+            return pagina
+
+    if ETAPAS_PREPROCESSAMENTO:
+        inicio = time.perf_counter()
+        imagem, pagina["pixels_antes"], pagina["pixels_ocr"] = preprocessar_imagem(imagem)
+        pagina["tempo_preprocessamento"] = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    with obter_pool_motores().motor() as motor:
+        if confianca:
+            pagina["texto"], pagina["confianca"] = motor.reconhecer_com_confianca(imagem, dpi)
+        else:
+            pagina["texto"] = motor.reconhecer(imagem, dpi)
+    pagina["tempo_ocr"] = time.perf_counter() - inicio
+
+    if cache is not None:
+        pagina["bytes_cache"] = cache.gravar(chave, pagina["texto"], pagina["confianca"])
+    return pagina
+
+def aplicar_limite_cache_ocr():
+    """
+    Aplica o limite de tamanho do cache de OCR, se estiver ativo.
+    """
+    cache = obter_cache_ocr()
+    if cache is not None:
+        cache.aplicar_limite()
+
+def resolucoes_ocr():
+    """
+    Retorna as resoluções tentadas em cada página, da primeira à última.
+    """
+    return tuple(sorted(OCR_DPIS_ADAPTATIVOS)) if OCR_DPI_ADAPTATIVO else (OCR_DPI,)
+
+def leitura_suficiente(pagina):
+    """
+    Indica se a leitura dispensa uma nova tentativa em resolução maior: a confiança
+    média das palavras e a fração de linhas reconhecidas pelo padrão devem atingir
+    CONFIANCA_MINIMA_OCR e TAXA_MINIMA_LINHAS. Guarda na página as linhas aceitas.
+    """
+    linhas, ignoradas = extrair_linhas_texto(pagina["texto"])
+    pagina["linhas_aceitas"] = len(linhas)
+    if pagina["confianca"] is not None and pagina["confianca"] < CONFIANCA_MINIMA_OCR:
+        return False
+    total = len(linhas) + len(ignoradas)
+    return total > 0 and len(linhas) / total >= TAXA_MINIMA_LINHAS
+
+def ocr_imagem_adaptativo(caminho_pdf, numero_pagina, imagem):
+    """
+    Lê uma página já renderizada na primeira das resoluções_ocr(); se a leitura não for
+    suficiente, renderiza e lê de novo nas resoluções seguintes. Fica com a tentativa
+    com mais linhas aceitas (e, no empate, maior confiança), somando os tempos de todas.
+    """
+    resolucoes = resolucoes_ocr()
+    if len(resolucoes) == 1:
+        return ocr_imagem(imagem, resolucoes[0])
+
+    melhor = None
+    tempos = {"tempo_renderizacao": 0.0, "tempo_preprocessamento": 0.0, "tempo_ocr": 0.0}
+    for tentativa, dpi in enumerate(resolucoes):
+        if tentativa:
+            inicio = time.perf_counter()
+            imagem = renderizar_paginas(caminho_pdf, numero_pagina, numero_pagina, dpi)[0]
+            tempos["tempo_renderizacao"] += time.perf_counter() - inicio
+        pagina = ocr_imagem(imagem, dpi, confianca=True)
+        del imagem
+        for nome in ("tempo_preprocessamento", "tempo_ocr"):
+            tempos[nome] += pagina[nome]
+        tempos["bytes_cache"] = tempos.get("bytes_cache", 0) + pagina.get("bytes_cache", 0)
+        suficiente = leitura_suficiente(pagina)
+        if melhor is None or ((pagina["linhas_aceitas"], pagina["confianca"] or 0.0)
+                              >= (melhor["linhas_aceitas"], melhor["confianca"] or 0.0)):
+            melhor = pagina
+        if suficiente:
+            break
+    melhor.update(tempos)
+    melhor["tentativas"] = tentativa + 1
+    return melhor
+
+def ocr_pagina(caminho_pdf, numero_pagina):
+    """
+    Renderiza uma única página do PDF e executa o OCR nela.
+    Executada nos processos do pool, por isso recebe apenas o caminho e o número da página
+    e devolve o dicionário de ocr_imagem, com o tempo de renderização.
+    """
+    inicio = time.perf_counter()
+    imagem = renderizar_paginas(caminho_pdf, numero_pagina, numero_pagina, resolucoes_ocr()[0])[0]
+    renderizacao = time.perf_counter() - inicio
+    pagina = ocr_imagem_adaptativo(caminho_pdf, numero_pagina, imagem)
+    pagina["tempo_renderizacao"] = pagina.get("tempo_renderizacao", 0.0) + renderizacao
+    return pagina
+
+def ocr_paginas_renderizadas(caminho_pdf, numeros_pagina):
+    """
+    Versão serial de ocr_pagina: renderiza as páginas em janelas (iterar_paginas)
+    e gera (numero_pagina, dicionário de ocr_imagem) com o tempo de renderização.
+    """
+    imagens = iterar_paginas(caminho_pdf, numeros_pagina, dpi=resolucoes_ocr()[0])
+    while True:
+        inicio = time.perf_counter()
+        try:
+            numero, imagem = next(imagens)
+        except StopIteration:
+            return
+        renderizacao = time.perf_counter() - inicio
+        pagina = ocr_imagem_adaptativo(caminho_pdf, numero, imagem)
+        del imagem
+        pagina["tempo_renderizacao"] = pagina.get("tempo_renderizacao", 0.0) + renderizacao
+        yield numero, pagina
+
+def extrair_linhas_texto(texto):
+    """
+    Aplica o padrão de linha ao texto de uma página.
+    Retorna (linhas relevantes, linhas ignoradas); as ignoradas são registradas
+    por RelatorioLinhasIgnoradas, uma única vez por documento.
+    """
+    linhas_relevantes = []
+    ignoradas = []
+    texto = re.sub(r"\s{2,}", " ", texto)
+
+    for linha in texto.split("\n"):
+        linha = linha.strip()
+        match = PADRAO_LINHA.search(linha)
+        if match:
+            data_mov = match.group(1)
+            historico = re.sub(r"[^a-zA-Z\s]", "", match.group(2)).strip()
+            valor = match.group(3).replace(" ", "")
+            linhas_relevantes.append([data_mov, historico, valor])
+        elif linha:
+            ignoradas.append(linha)
+
+    return linhas_relevantes, ignoradas
+
+def montar_dataframe(linhas_relevantes):
+    """
+    Cria o DataFrame a partir das linhas extraídas, incluindo colunas padrão.
+    """
+    df = pd.DataFrame(linhas_relevantes, columns=["Data Mov.", "Histórico", "Valor", "Página"])
+    df["Cód. Conta Debito"] = None
+    df["Cód. Conta Credito"] = None
+    df["Cód. Histórico"] = None
+
+    # Remover linhas onde o campo "Histórico" contém "SALDO"
+    df = df[~df["Histórico"].str.contains("SALDO", case=False, na=False)]
+
+    # Remover linhas onde o campo "Valor" é igual a 0
+    df = df[df["Valor"] != 0]
+
+
+    # Adicionar colunas personalizadas
+    df = adicionar_colunas_personalizadas(df)
+
+    return df
+
+def _paginas_em_ordem(total_paginas, camada, paginas_ocr):
+    """
+    Intercala as páginas da camada de texto e do OCR na ordem das páginas.
+    """
+    for numero in range(1, total_paginas + 1):
+        if numero in camada:
+            yield {"texto": camada[numero], "fonte": "texto", "pixels_antes": 0, "pixels_ocr": 0}
+        else:
+            _, pagina = next(paginas_ocr)
+            yield pagina
+
+def preparar_paginas(caminho_pdf, pool=None):
+    """
+    Separa as páginas com camada de texto das que precisam de OCR.
+    Com pool, o OCR das páginas digitalizadas é enviado imediatamente aos processos.
+    Retorna (gerador das páginas lidas em ordem, futuros enviados ao pool, total de páginas).
+    """
+    metricas = metricas_documento(caminho_pdf)
+    with metricas.etapa("contagem_paginas"):
+        total_paginas = contar_paginas(caminho_pdf)
+    with metricas.etapa("camada_texto"):
+        camada = extrair_camada_texto(caminho_pdf, total_paginas) if USAR_CAMADA_TEXTO else {}
+    numeros_ocr = [numero for numero in range(1, total_paginas + 1) if numero not in camada]
+    if camada:
+        logging.info(f"{caminho_pdf}: {len(camada)} página(s) com camada de texto, {len(numeros_ocr)} com OCR.")
+
+    futuros = []
+    if pool is not None:
+        futuros = [pool.submit(ocr_pagina, caminho_pdf, numero) for numero in numeros_ocr]
+        paginas_ocr = ((numero, futuro.result()) for numero, futuro in zip(numeros_ocr, futuros))
+    else:
+        # Cada página é renderizada, lida e descartada antes da próxima
+        paginas_ocr = ocr_paginas_renderizadas(caminho_pdf, numeros_ocr)
+
+    return _paginas_em_ordem(total_paginas, camada, paginas_ocr), futuros, total_paginas
+
+# Linhas ignoradas mantidas como exemplo no resumo de cada documento
+AMOSTRA_LINHAS_IGNORADAS = 5
+# Diretório que recebe, por documento, todas as linhas ignoradas (None desativa)
+LINHAS_IGNORADAS_DIR = os.environ.get("GENESIS_LINHAS_IGNORADAS_DIR")
+
+class RelatorioLinhasIgnoradas:
+    """
+    Conta as linhas que não correspondem ao padrão por página e guarda uma amostra,
+    registrando um único resumo por documento no lugar de uma mensagem por linha.
+    Com LINHAS_IGNORADAS_DIR, grava também a lista completa, página a página.
+    """
+    def __init__(self, caminho_pdf):
+        self.caminho_pdf = caminho_pdf
+        self.total = 0
+        self.por_pagina = {}
+        self.amostra = []
+        self._detalhes = [] if LINHAS_IGNORADAS_DIR else None
+
+    def adicionar(self, numero_pagina, ignoradas):
+        if not ignoradas:
+            return
+        self.total += len(ignoradas)
+        self.por_pagina[numero_pagina] = len(ignoradas)
+        faltam = AMOSTRA_LINHAS_IGNORADAS - len(self.amostra)
+        if faltam > 0:
+            self.amostra.extend((numero_pagina, linha) for linha in ignoradas[:faltam])
+        if self._detalhes is not None:
+            self._detalhes.append((numero_pagina, ignoradas))
+
+    def registrar(self):
+        """
+        Registra o resumo no log e, se configurado, grava o arquivo com todas as linhas.
+        """
+        if not self.total:
+            return
+        paginas = ", ".join(f"{numero}: {quantidade}" for numero, quantidade in self.por_pagina.items())
+        amostra = "; ".join(f"[p{numero}] {linha}" for numero, linha in self.amostra)
+        logging.warning(f"{self.caminho_pdf}: {self.total} linha(s) ignorada(s) (não correspondem ao padrão) "
+                        f"em {len(self.por_pagina)} página(s) - por página {{{paginas}}} - exemplos: {amostra}")
+        if self._detalhes:
+            self._gravar_detalhes()
+
+    def _gravar_detalhes(self):
+        os.makedirs(LINHAS_IGNORADAS_DIR, exist_ok=True)
+        nome_pdf = os.path.splitext(os.path.basename(self.caminho_pdf))[0]
+        caminho = os.path.join(LINHAS_IGNORADAS_DIR, f"{nome_pdf}_linhas_ignoradas.txt")
+        with open(caminho, "w", encoding="utf-8") as arquivo:
+            for numero, linhas in self._detalhes:
+                arquivo.write(f"--- Página {numero} ({len(linhas)} linha(s)) ---\n")
+                arquivo.write("\n".join(linhas) + "\n")
+        logging.info(f"Linhas ignoradas de {self.caminho_pdf} gravadas em: {caminho}")
+
+def ler_paginas(caminho_pdf, paginas, total_paginas, progresso=None, cancelamento=None):
+    """
+    Consome as páginas lidas, na ordem, e retorna as linhas relevantes do documento
+    (data, histórico, valor e número da página).
+    Os tempos e contagens de cada página vão para as métricas do documento; ao final
+    registra no log o resumo das linhas ignoradas, a resolução usada no OCR (no modo
+    adaptativo) e quantos pixels o pré-processamento deixou de enviar ao OCR.
+    """
+    metricas = metricas_documento(caminho_pdf)
+    relatorio = RelatorioLinhasIgnoradas(caminho_pdf)
+    cache = obter_cache_ocr()
+    resolucoes = {}  # DPI usado no OCR -> páginas
+    linhas_relevantes = []
+    pixels_antes = pixels_ocr = 0
+    for numero, pagina in enumerate(paginas, start=1):
+        if cancelamento is not None and cancelamento.is_set():
+            raise ProcessamentoCancelado(caminho_pdf)
+        inicio = time.perf_counter()
+        linhas, ignoradas = extrair_linhas_texto(pagina["texto"])
+        metricas.adicionar_tempo("parser", time.perf_counter() - inicio)
+        linhas_relevantes.extend([*linha, numero] for linha in linhas)  # Página de origem de cada linha
+        relatorio.adicionar(numero, ignoradas)
+
+        for etapa in ("renderizacao", "preprocessamento", "ocr"):
+            if pagina.get(f"tempo_{etapa}"):
+                metricas.adicionar_tempo(etapa, pagina[f"tempo_{etapa}"])
+        metricas.contar("paginas")
+        metricas.contar(f"paginas_{pagina['fonte']}")
+        if "dpi" in pagina:
+            metricas.contar(f"paginas_{pagina['dpi']}dpi")
+            resolucoes[pagina["dpi"]] = resolucoes.get(pagina["dpi"], 0) + 1
+            if pagina.get("tentativas", 1) > 1:
+                metricas.contar("paginas_reprocessadas")
+            metricas.detalhar_pagina(numero, fonte=pagina["fonte"], dpi=pagina["dpi"],
+                                     confianca=None if pagina["confianca"] is None else round(pagina["confianca"], 1),
+                                     tentativas=pagina.get("tentativas", 1))
+        metricas.contar("linhas_aceitas", len(linhas))
+        metricas.contar("linhas_ignoradas", len(ignoradas))
+        pixels_antes += pagina["pixels_antes"]
+        pixels_ocr += pagina["pixels_ocr"]
+        if cache is not None and pagina.get("bytes_cache"):
+            cache.registrar_gravacao(pagina["bytes_cache"])  # Gravado aqui ou em um processo do pool
+        if progresso is not None:
+            progresso(pagina=numero, total=total_paginas)
+
+    relatorio.registrar()
+    if OCR_DPI_ADAPTATIVO and resolucoes:
+        logging.info(f"{caminho_pdf}: páginas lidas por DPI {dict(sorted(resolucoes.items()))}.")
+    if pixels_antes:
+        economia = pixels_antes - pixels_ocr
+        logging.info(f"{caminho_pdf}: pré-processamento economizou {economia} pixels "
+                     f"({economia / pixels_antes:.1%}) no OCR.")
+    return linhas_relevantes
+
+def extrair_dados_ocr(caminho_pdf, workers=None, progresso=None, cancelamento=None):
+    """
+    Extrai os dados do PDF utilizando OCR, incluindo colunas padrão.
+    Páginas com camada de texto vão direto ao parser; as demais passam pelo OCR.
+    Com mais de um worker, as páginas são processadas em paralelo no pool de OCR;
+    os textos são sempre consumidos na ordem das páginas.
+    `progresso(pagina=, total=)` é chamado a cada página lida e `cancelamento`
+    (threading.Event) interrompe o processamento com ProcessamentoCancelado.
+    """
+    workers = workers or OCR_WORKERS
+    futuros = []
+    try:
+        pool = obter_pool_ocr(workers) if workers > 1 else None
+        paginas, futuros, total_paginas = preparar_paginas(caminho_pdf, pool)
+
+        linhas_relevantes = ler_paginas(caminho_pdf, paginas, total_paginas, progresso, cancelamento)
 
+        with metricas_documento(caminho_pdf).etapa("montagem"):
+            df = montar_dataframe(linhas_relevantes)
+        aplicar_limite_cache_ocr()
+
+        if RASTREAMENTO:
+            logging.debug(f"Dados extraídos do PDF {caminho_pdf}: {df.head()}")
+        return df
+
+    except ProcessamentoCancelado:
+        for futuro in futuros:
+            futuro.cancel()
+        raise
     except Exception as e:
+        for futuro in futuros:
+            futuro.cancel()
         logging.error(f"Erro ao processar PDF com OCR: {e}")
         return pd.DataFrame()
+
+def extrair_dados_ocr_lote(caminhos_pdf, workers=None):
+    """
+    Extrai os dados de vários PDFs, enviando as páginas de todos eles ao pool de OCR de uma vez.
+    Gera (caminho_pdf, df) na ordem dos arquivos recebidos; um PDF com erro gera um DataFrame vazio.
+    """
+    pool = obter_pool_ocr(workers)
+    pendentes = []
+    for caminho_pdf in caminhos_pdf:
+        try:
+            paginas, futuros, total_paginas = preparar_paginas(caminho_pdf, pool)
+        except Exception as e:
+            logging.error(f"Erro ao processar PDF com OCR: {e}")
+            paginas, futuros, total_paginas = None, [], 0
+        pendentes.append((caminho_pdf, paginas, futuros, total_paginas))
+
+    for caminho_pdf, paginas, futuros, total_paginas in pendentes:
+        if paginas is None:
+            yield caminho_pdf, pd.DataFrame()
+            continue
+        try:
+            linhas_relevantes = ler_paginas(caminho_pdf, paginas, total_paginas)
+            with metricas_documento(caminho_pdf).etapa("montagem"):
+                df = montar_dataframe(linhas_relevantes)
+            yield caminho_pdf, df
+        except Exception as e:
+            for futuro in futuros:
+                futuro.cancel()
+            logging.error(f"Erro ao processar PDF com OCR: {e}")
+            yield caminho_pdf, pd.DataFrame()
+
+    aplicar_limite_cache_ocr()
+
 def remover_numeros_inicio_historico(df):
     """
     Remove números e espaços no início da coluna 'Histórico', mantendo apenas o restante da string.
@@ -170,6 +1484,9 @@ def formatar_valor(df):
     """
     Formata os valores extraídos.
     """
+    df["Valor"] = converter_valores_cd(df["Valor"])
+    return df
+
 def ajustar_valor(valor):
     """
     Converte valores terminados em 'C' para positivos e 'D' para negativos.
@@ -191,31 +1508,52 @@ def ajustar_valor(valor):
 
     return valor  # Retorna o valor original caso não precise ser alterado
 
+def converter_valores_cd(serie):
+    """
+    Versão vetorizada de ajustar_valor: converte uma coluna inteira de uma vez.
+    Textos no formato 1.234,56C/D viram números (D negativo); os demais valores são mantidos.
+    """
+    try:
+        partes = serie.str.strip().str.replace(" ", "", regex=False).str.extract(
+            r"^(-?[\d\.]+),(\d{2})([CD]?)$"
+        )
+    except AttributeError:
+        return serie  # Coluna sem textos
+
+    convertidos = partes[0].notna()
+    if not convertidos.any():
+        return serie
+
+    partes = partes[convertidos]
+    numeros = (partes[0].str.replace(".", "", regex=False) + "." + partes[1]).astype(float)
+    numeros = numeros.where(partes[2] != "D", -numeros)
+
+    resultado = serie.astype(object)
+    resultado[convertidos] = numeros.astype(object)
+    return resultado
+
 def adicionar_colunas_personalizadas(df):
     """
     Adiciona as colunas Cód. Conta Débito, Cód. Conta Crédito e Cód. Histórico ao DataFrame
     com base na base de dados externa.
     """
     try:
-        # Carregar a base de dados externa
-        base_dados = pd.read_excel(BASE_DADOS_PATH)
+        # Carregar o índice da base de dados externa (lido do Excel somente se ele mudou)
+        indice = carregar_indice_base()
 
         # Normalizar os valores para evitar diferenças de capitalização ou espaços
-        base_dados["Histórico"] = base_dados["Histórico"].str.strip().str.upper()
         df["Histórico"] = df["Histórico"].str.strip().str.upper()
 
-        # Criar mapeamento para as colunas
-        mapeamento_debito = base_dados.set_index("Histórico")["Cód. Conta Debito"].to_dict()
-        mapeamento_credito = base_dados.set_index("Histórico")["Cód. Conta Credito"].to_dict()
-        mapeamento_historico = base_dados.set_index("Histórico")["Cód. Histórico"].to_dict()
-
         # Adicionar colunas ao DataFrame com os valores mapeados
-        df["Cód. Conta Debito"] = df["Histórico"].map(mapeamento_debito)
-        df["Cód. Conta Credito"] = df["Histórico"].map(mapeamento_credito)
-        df["Cód. Histórico"] = df["Histórico"].map(mapeamento_historico)
+        df["Cód. Conta Debito"] = df["Histórico"].map(indice["por_coluna"]["Cód. Conta Debito"])
+        df["Cód. Conta Credito"] = df["Histórico"].map(indice["por_coluna"]["Cód. Conta Credito"])
+        df["Cód. Histórico"] = df["Histórico"].map(indice["por_coluna"]["Cód. Histórico"])
 
         # Verificação de correspondência
-        valores_nao_encontrados = df[~df["Histórico"].isin(base_dados["Histórico"])]["Histórico"].unique()
+        encontrados = df["Histórico"].isin(indice["mapeamento"].keys())
+        if CORRESPONDENCIA_APROXIMADA:
+            encontrados = aplicar_correspondencia_aproximada(df, indice, encontrados)
+        valores_nao_encontrados = df[~encontrados]["Histórico"].unique()
         if len(valores_nao_encontrados) > 0:
             logging.warning(f"Os seguintes valores do 'Histórico' não foram encontrados na base de dados: {valores_nao_encontrados}")
             print(f"Valores não encontrados na base de dados: {valores_nao_encontrados}")
@@ -227,104 +1565,1164 @@ def adicionar_colunas_personalizadas(df):
 
 
 
+def aplicar_correspondencia_aproximada(df, indice, encontrados):
+    """
+    Procura no índice de trigramas os históricos sem correspondência exata e preenche os
+    códigos com os do melhor candidato. Marca cada linha nas colunas "Correspondência"
+    (exata/aproximada), "Histórico Base" (chave usada) e "Similaridade".
+    Retorna a máscara das linhas com alguma correspondência.
+    """
+    indice_trigramas = obter_indice_trigramas(indice)
+    candidatos = {}
+    for historico in df.loc[~encontrados, "Histórico"].dropna().unique():
+        candidato = indice_trigramas.buscar(historico)
+        if candidato is not None:
+            candidatos[historico] = candidato
+
+    aproximados = ~encontrados & df["Histórico"].isin(candidatos.keys())
+    base = df["Histórico"].astype(object).where(encontrados, None)
+    base[aproximados] = df.loc[aproximados, "Histórico"].map(lambda historico: candidatos[historico][0])
+    similaridade = pd.Series(1.0, index=df.index).where(encontrados)
+    similaridade[aproximados] = df.loc[aproximados, "Histórico"].map(lambda historico: round(candidatos[historico][1], 3))
+    correspondencia = pd.Series(None, index=df.index, dtype=object)
+    correspondencia[encontrados] = "exata"
+    correspondencia[aproximados] = "aproximada"
+
+    for coluna in ["Cód. Conta Debito", "Cód. Conta Credito", "Cód. Histórico"]:
+        df.loc[aproximados, coluna] = base[aproximados].map(indice["por_coluna"][coluna])
+    df["Correspondência"] = correspondencia
+    df["Histórico Base"] = base
+    df["Similaridade"] = similaridade
+
+    if candidatos:
+        exemplos = "; ".join(f"{historico} -> {chave} ({similaridade:.2f})"
+                             for historico, (chave, similaridade) in itertools.islice(candidatos.items(), 10))
+        logging.info(f"{len(candidatos)} histórico(s) com correspondência aproximada: {exemplos}")
+    return encontrados | aproximados
+
 def adicionar_coluna_historico(df):
     """
     Adiciona a coluna "Código" ao DataFrame com base na base de dados externa.
     """
     try:
-        # Carregar a base de dados externa
-        base_dados = pd.read_excel(BASE_DADOS_PATH)
+        # Carregar o índice da base de dados externa
+        indice = carregar_indice_base()
 
-        # Garantir que as colunas necessárias estão presentes na base
-        if "Histórico" not in base_dados.columns or "Código" not in base_dados.columns:
+        # Garantir que a coluna necessária está presente na base
+        if not indice["tem_codigo"]:
             raise ValueError("A base de dados deve conter as colunas 'Histórico' e 'Código'.")
 
-        # Criar um dicionário para mapear histórico -> código
-        mapeamento_codigo = dict(zip(base_dados["Histórico"], base_dados["Código"]))
+        # Mapeamento histórico normalizado -> código
+        mapeamento_codigo = indice["por_coluna"]["Código"]
 
-        # Adicionar depuração
-        print("Mapeamento de 'Histórico' para 'Código':")
-        print(mapeamento_codigo)
+        if RASTREAMENTO:
+            logging.debug(f"Mapeamento de 'Histórico' para 'Código': {mapeamento_codigo}")
 
-        # Adicionar a coluna "Código" ao DataFrame com base no mapeamento
-        df["Código"] = df["Histórico"].map(mapeamento_codigo)
+        # Adicionar a coluna "Código" ao DataFrame com base no mapeamento (pela chave da
+        # base encontrada, quando houver correspondência aproximada)
+        chaves = df["Histórico Base"] if "Histórico Base" in df.columns else df["Histórico"]
+        df["Código"] = chaves.map(mapeamento_codigo)
 
         return df
     except Exception as e:
         logging.error(f"Erro ao adicionar coluna 'Código': {e}")
         return df
 
+# Colunas de procedência (além do arquivo de origem) que não vão para a planilha de cada PDF
+COLUNAS_PROCEDENCIA = ["Página"]
+
+# Linhas por planilha do Excel; ao atingir o limite, a gravação continua em outra planilha
+LIMITE_LINHAS_PLANILHA = 1_048_576
+
+def linhas_planilha(df):
+    """
+    Gera as linhas do DataFrame como listas prontas para o openpyxl (NaN/None viram célula vazia).
+    """
+    for linha in df.itertuples(index=False, name=None):
+        yield [None if pd.isna(valor) else valor for valor in linha]
+
+def gravar_excel_streaming(caminho_excel, blocos, colunas):
+    """
+    Grava os DataFrames de `blocos` em um .xlsx no modo somente escrita do openpyxl:
+    as linhas vão direto para o arquivo, sem montar a pasta de trabalho em memória.
+    O arquivo é gravado com outro nome e só substitui o destino quando está completo.
+    """
+    temporario = f"{os.path.splitext(caminho_excel)[0]}.{os.getpid()}.tmp.xlsx"
+    livro = openpyxl.Workbook(write_only=True)
+    planilha = None
+    linhas = LIMITE_LINHAS_PLANILHA
+    try:
+        for bloco in blocos:
+            for linha in linhas_planilha(bloco[colunas]):
+                if linhas >= LIMITE_LINHAS_PLANILHA:
+                    planilha = livro.create_sheet(title=f"Sheet{len(livro.worksheets) + 1}")
+                    planilha.append(colunas)
+                    linhas = 1
+                planilha.append(linha)
+                linhas += 1
+        if planilha is None:
+            livro.create_sheet(title="Sheet1").append(colunas)
+        livro.save(temporario)
+    except BaseException:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+        raise
+    os.replace(temporario, caminho_excel)
+
 def salvar_excel_formatado(df, caminho_pdf, diretorio_saida):
     """
-    Salva os dados extraídos em um arquivo Excel com nome baseado no PDF.
+    Salva os dados extraídos em um arquivo Excel com nome baseado no PDF, pelo gravador
+    em streaming. Retorna o caminho do arquivo salvo (None em caso de erro).
     """
     try:
         nome_pdf = os.path.splitext(os.path.basename(caminho_pdf))[0]
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         caminho_excel = os.path.join(diretorio_saida, f"{nome_pdf}_{timestamp}.xlsx")
 
-        # Adicionar depuração antes de salvar
-        print("Colunas no DataFrame antes de salvar no Excel:")
-        print(df.columns)
-        print("Exemplo de dados no DataFrame antes de salvar:")
-        print(df.head())
+        # A página de origem fica só na saída consolidada; a planilha mantém o layout de sempre
+        df = df.drop(columns=COLUNAS_PROCEDENCIA, errors="ignore")
+
+        if RASTREAMENTO:
+            logging.debug(f"Colunas no DataFrame antes de salvar no Excel: {list(df.columns)}")
+            logging.debug(f"Exemplo de dados no DataFrame antes de salvar:\n{df.head()}")
 
-        df.to_excel(caminho_excel, index=False)
+        gravar_excel_streaming(caminho_excel, [df], list(df.columns))
         logging.info(f"Dados salvos com sucesso em: {caminho_excel}")
+        return caminho_excel
     except Exception as e:
         logging.error(f"Erro ao salvar Excel: {e}")
 
+# Linhas formatadas e gravadas por vez pelo exportador TXT
+TAMANHO_BLOCO_TXT = 100_000
+
+# Colunas do layout TXT, na ordem em que são gravadas
+COLUNAS_TXT = [
+    "Data Mov.", "Cód. Conta Credito", "Cód. Conta Debito",
+    "Valor", "Cód. Histórico", "Histórico"
+]
+
+def formatar_valores_txt(valores):
+    """
+    Formata uma coluna de valores no padrão 1.234,56 de uma só vez.
+    """
+    return valores.map("{:,.2f}".format).str.translate(str.maketrans(",.", ".,"))
+
+def formatar_linhas_txt(df):
+    """
+    Formata as linhas do TXT coluna a coluna, sem alterar o DataFrame recebido.
+    Retorna uma Series com uma linha do layout por lançamento.
+    """
+    colunas = {coluna: df[coluna] for coluna in COLUNAS_TXT}
+
+    # Garantir que os valores das colunas de código sejam inteiros e depois convertidos para strings
+    for coluna in ["Cód. Conta Credito", "Cód. Conta Debito", "Cód. Histórico"]:
+        colunas[coluna] = colunas[coluna].fillna(0).astype(int).astype(str)
+
+    # Ajustar a formatação dos valores
+    colunas["Valor"] = formatar_valores_txt(colunas["Valor"])
+
+    # As demais colunas seguem a conversão de texto do Python (None -> "None", como antes)
+    for coluna in ["Data Mov.", "Histórico"]:
+        colunas[coluna] = colunas[coluna].map(str)
+
+    primeira, *demais = (colunas[coluna] for coluna in COLUNAS_TXT)
+    # Lote "1" e as colunas Filial e Centro de Custo vazias
+    return primeira.str.cat(demais, sep=";") + ";1;;;"
+
 def salvar_txt_formatado(df, caminho_pdf, diretorio_saida):
     """
     Salva os dados extraídos em um arquivo TXT com campos reorganizados.
+    As linhas são formatadas e gravadas em blocos de TAMANHO_BLOCO_TXT lançamentos.
+    Retorna o caminho do arquivo salvo (None em caso de erro).
     """
     try:
         nome_pdf = os.path.splitext(os.path.basename(caminho_pdf))[0]
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         caminho_txt = os.path.join(diretorio_saida, f"{nome_pdf}_{timestamp}.txt")
 
-        # Adicionar as novas colunas com valores padrão
-        df["Lote"] = "1"  # Coluna com valor padrão
-        df["Filial"] = ""  # Coluna vazia
-        df["Centro de Custo"] = ""  # Coluna vazia
-
-        # Reorganizar as colunas para o TXT
-        colunas_reorganizadas = [
-            "Data Mov.", "Cód. Conta Credito", "Cód. Conta Debito",
-            "Valor", "Cód. Histórico", "Histórico", "Lote"
-        ]
-        df = df[colunas_reorganizadas]
-
-        # Garantir que os valores das colunas de código sejam inteiros e depois convertidos para strings
-        colunas_numericas = ["Cód. Conta Credito", "Cód. Conta Debito", "Cód. Histórico"]
-        for coluna in colunas_numericas:
-            df[coluna] = df[coluna].fillna(0).astype(int).astype(str)
-
-        # Ajustar a formatação dos valores
-        def formatar_valor(valor):
-            return f"{valor:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
-
-        df["Valor"] = df["Valor"].apply(formatar_valor)
-
-        # Formatar o conteúdo de cada linha no estilo desejado
-        linhas_formatadas = []
-        for _, row in df.iterrows():
-            linha = (
-                f"{row['Data Mov.']};{row['Cód. Conta Credito']};{row['Cód. Conta Debito']};"
-                f"{row['Valor']};{row['Cód. Histórico']};{row['Histórico']};{row['Lote']};;;"
-            )
-            linhas_formatadas.append(linha)
-
         # Salvar as linhas formatadas no arquivo TXT
         with open(caminho_txt, "w", encoding="utf-8") as arquivo_txt:
-            arquivo_txt.write("\n".join(linhas_formatadas))
+            for inicio in range(0, len(df), TAMANHO_BLOCO_TXT):
+                linhas = formatar_linhas_txt(df.iloc[inicio:inicio + TAMANHO_BLOCO_TXT])
+                if inicio:
+                    arquivo_txt.write("\n")
+                arquivo_txt.write("\n".join(linhas))
 
         logging.info(f"Dados salvos com sucesso em: {caminho_txt}")
         print(f"Arquivo TXT salvo com sucesso: {caminho_txt}")
+        return caminho_txt
     except Exception as e:
         logging.error(f"Erro ao salvar TXT: {e}")
         print(f"Erro ao salvar TXT: {e}")
 
+# Saída consolidada: além do Excel e do TXT de cada PDF, grava os lançamentos de todos
+# os documentos em um único conjunto Parquet (uma parte por PDF em `consolidado/`),
+# com o arquivo e a página de origem de cada linha
+SAIDA_CONSOLIDADA = os.environ.get("GENESIS_SAIDA_CONSOLIDADA") == "1"
+DIRETORIO_CONSOLIDADO = "consolidado"
+
+def esquema_consolidado():
+    """
+    Esquema fixo do conjunto consolidado, para que as partes de todos os PDFs sejam compatíveis.
+    """
+    return pa.schema([
+        ("Arquivo", pa.string()),
+        ("Página", pa.int32()),
+        ("Data Mov.", pa.string()),
+        ("Histórico", pa.string()),
+        ("Valor", pa.float64()),
+        ("Cód. Conta Debito", pa.int64()),
+        ("Cód. Conta Credito", pa.int64()),
+        ("Cód. Histórico", pa.int64()),
+        ("Código", pa.string()),
+        ("Correspondência", pa.string()),
+        ("Histórico Base", pa.string()),
+        ("Similaridade", pa.float64()),
+    ])
+
+def tabela_consolidada(df, caminho_pdf):
+    """
+    Converte os lançamentos de um PDF para o esquema consolidado.
+    """
+    def coluna(nome):
+        return df[nome] if nome in df.columns else pd.Series(None, index=df.index, dtype=object)
+
+    def texto(nome):
+        return coluna(nome).map(lambda valor: None if pd.isna(valor) else str(valor))
+
+    dados = pd.DataFrame({
+        "Arquivo": os.path.abspath(caminho_pdf),
+        "Página": pd.to_numeric(coluna("Página"), errors="coerce").astype("Int32"),
+        "Data Mov.": texto("Data Mov."),
+        "Histórico": texto("Histórico"),
+        "Valor": pd.to_numeric(coluna("Valor"), errors="coerce").astype(float),
+        "Cód. Conta Debito": pd.to_numeric(coluna("Cód. Conta Debito"), errors="coerce").astype("Int64"),
+        "Cód. Conta Credito": pd.to_numeric(coluna("Cód. Conta Credito"), errors="coerce").astype("Int64"),
+        "Cód. Histórico": pd.to_numeric(coluna("Cód. Histórico"), errors="coerce").astype("Int64"),
+        "Código": texto("Código"),
+        "Correspondência": texto("Correspondência"),
+        "Histórico Base": texto("Histórico Base"),
+        "Similaridade": pd.to_numeric(coluna("Similaridade"), errors="coerce").astype(float),
+    }, index=df.index)
+    return pa.Table.from_pandas(dados, schema=esquema_consolidado(), preserve_index=False)
+
+def salvar_consolidado(df, caminho_pdf, diretorio_saida):
+    """
+    Grava os lançamentos do PDF como uma parte do conjunto Parquet consolidado.
+    O nome da parte é derivado do caminho e do conteúdo do PDF: reprocessá-lo substitui
+    as linhas anteriores, e outro extrato com o mesmo nome de arquivo ganha a própria parte.
+    Retorna o caminho da parte (None em caso de erro).
+    """
+    try:
+        diretorio = os.path.join(diretorio_saida, DIRETORIO_CONSOLIDADO)
+        os.makedirs(diretorio, exist_ok=True)
+        nome_pdf = os.path.splitext(os.path.basename(caminho_pdf))[0]
+        origem = f"{os.path.abspath(caminho_pdf)}|{calcular_hash_arquivo(caminho_pdf)}"
+        sufixo = hashlib.sha1(origem.encode("utf-8")).hexdigest()[:10]
+        caminho_parte = os.path.join(diretorio, f"{nome_pdf}_{sufixo}.parquet")
+
+        # Arquivos iniciados por "_" são ignorados na leitura do conjunto
+        temporario = os.path.join(diretorio, f"_{nome_pdf}_{sufixo}.{os.getpid()}.tmp")
+        pq.write_table(tabela_consolidada(df, caminho_pdf), temporario)
+        os.replace(temporario, caminho_parte)
+        logging.info(f"Dados consolidados em: {caminho_parte}")
+        return caminho_parte
+    except Exception as e:
+        logging.error(f"Erro ao salvar a saída consolidada: {e}")
+
+def exportar_consolidado_excel(diretorio_saida, caminho_excel):
+    """
+    Converte o conjunto consolidado do diretório de saída em um único .xlsx, lendo
+    LINHAS_BLOCO_EXCEL linhas por vez e gravando em streaming (memória constante).
+    Retorna o número de lançamentos gravados.
+    """
+    conjunto = ds.dataset(os.path.join(diretorio_saida, DIRETORIO_CONSOLIDADO), format="parquet",
+                          schema=esquema_consolidado())
+    total = 0
+
+    def blocos():
+        nonlocal total
+        for lote in conjunto.to_batches(batch_size=LINHAS_BLOCO_EXCEL):
+            total += lote.num_rows
+            yield lote.to_pandas()
+
+    gravar_excel_streaming(caminho_excel, blocos(), conjunto.schema.names)
+    logging.info(f"Conjunto consolidado exportado para: {caminho_excel} ({total} linhas)")
+    return total
+
+# Manifesto gravado em cada diretório de saída com o hash, a situação e as saídas de
+# cada PDF, para que um lote interrompido seja retomado sem refazer o que já terminou
+NOME_MANIFESTO = "genesis_manifesto.sqlite"
+
+def tipos_saida():
+    """
+    Retorna as saídas que cada PDF deve gerar com as opções atuais.
+    """
+    return ("excel", "txt", "consolidado") if SAIDA_CONSOLIDADA else ("excel", "txt")
+
+def saidas_completas(saidas):
+    """
+    Indica se todas as saídas esperadas de um PDF foram geradas.
+    """
+    return all(saidas.get(tipo) for tipo in tipos_saida())
+
+def assinatura_processamento():
+    """
+    Identifica a base de dados (pelo hash) e as opções que alteram as saídas de um PDF.
+    Um PDF concluído com outra assinatura é processado de novo.
+    """
+    try:
+        hash_base = carregar_indice_base()["hash"]
+    except Exception:
+        hash_base = None  # O erro da base aparece no processamento
+    opcoes = (hash_base, OCR_DPI, OCR_DPI_ADAPTATIVO, OCR_DPIS_ADAPTATIVOS, CONFIANCA_MINIMA_OCR,
+              TAXA_MINIMA_LINHAS, OCR_LANG, OCR_CONFIG, ETAPAS_PREPROCESSAMENTO, USAR_CAMADA_TEXTO,
+              CORRESPONDENCIA_APROXIMADA, SIMILARIDADE_MINIMA, MARGEM_MINIMA_CANDIDATOS)
+    return hashlib.sha1(repr(opcoes).encode()).hexdigest()
+
+class ManifestoLotes:
+    """
+    Manifesto persistente (SQLite) dos PDFs processados para um diretório de saída.
+    Um PDF cujo conteúdo (hash) já foi concluído com a mesma base de dados e opções
+    (assinatura_processamento) e cujas saídas ainda existem não é processado de novo,
+    mesmo que tenha sido copiado com outro nome.
+    Há um registro por caminho e conteúdo: um PDF novo com o nome de um já processado
+    (extratos baixados do banco repetem nomes) ganha o próprio registro e não apaga
+    as saídas do anterior.
+    Cada operação abre a própria conexão, para que o manifesto possa ser usado por várias threads.
+    """
+    def __init__(self, caminho):
+        self.caminho = caminho
+        with self._conectar() as conexao:
+            conexao.execute(
+                "CREATE TABLE IF NOT EXISTS documentos ("
+                " caminho TEXT NOT NULL, hash TEXT NOT NULL, tamanho INTEGER, mtime_ns INTEGER,"
+                " situacao TEXT NOT NULL, excel TEXT, txt TEXT, consolidado TEXT, assinatura TEXT,"
+                " erro TEXT, atualizado_em TEXT, PRIMARY KEY (caminho, hash))"
+            )
+            conexao.execute("CREATE INDEX IF NOT EXISTS documentos_hash ON documentos (hash, situacao)")
+
+    @classmethod
+    def do_diretorio(cls, diretorio_saida):
+        return cls(os.path.join(diretorio_saida, NOME_MANIFESTO))
+
+    @contextlib.contextmanager
+    def _conectar(self):
+        conexao = sqlite3.connect(self.caminho, timeout=30)
+        try:
+            with conexao:  # Confirma a transação ao final (ou desfaz, em caso de erro)
+                yield conexao
+        finally:
+            conexao.close()
+
+    def identificar(self, caminho_pdf):
+        """
+        Retorna (hash, tamanho, mtime_ns) do PDF. Se o tamanho e a data de modificação
+        forem os registrados, o hash do manifesto é reaproveitado sem reler o arquivo.
+        """
+        stat = os.stat(caminho_pdf)
+        with self._conectar() as conexao:
+            registro = conexao.execute(
+                "SELECT hash, tamanho, mtime_ns FROM documentos WHERE caminho = ? AND tamanho = ? AND mtime_ns = ?",
+                (os.path.abspath(caminho_pdf), stat.st_size, stat.st_mtime_ns)
+            ).fetchone()
+        if registro is not None:
+            return registro
+        return calcular_hash_arquivo(caminho_pdf), stat.st_size, stat.st_mtime_ns
+
+    def verificar(self, caminho_pdf):
+        """
+        Retorna (identificação do PDF, registro já concluído com o mesmo conteúdo e a
+        mesma assinatura de processamento, ou None). O registro só vale se todas as
+        saídas esperadas existirem: com SAIDA_CONSOLIDADA, inclusive a parte consolidada.
+        """
+        identificacao = self.identificar(caminho_pdf)
+        with self._conectar() as conexao:
+            concluidos = conexao.execute(
+                "SELECT caminho, excel, txt, consolidado FROM documentos WHERE hash = ? AND situacao = 'concluido'"
+                " AND assinatura = ?", (identificacao[0], assinatura_processamento())
+            ).fetchall()
+        for caminho, excel, txt, consolidado in concluidos:
+            registro = {"caminho": caminho, "excel": excel, "txt": txt, "consolidado": consolidado}
+            if saidas_completas(registro) and all(os.path.exists(registro[tipo]) for tipo in tipos_saida()):
+                return identificacao, registro
+        return identificacao, None
+
+    def iniciar(self, caminho_pdf, identificacao):
+        """
+        Registra o PDF como em processamento; se o lote cair, ele continua pendente.
+        """
+        with self._conectar() as conexao:
+            conexao.execute(
+                "INSERT INTO documentos (caminho, hash, tamanho, mtime_ns, situacao, atualizado_em)"
+                " VALUES (?, ?, ?, ?, 'processando', ?)"
+                " ON CONFLICT (caminho, hash) DO UPDATE SET tamanho = excluded.tamanho,"
+                " mtime_ns = excluded.mtime_ns, situacao = excluded.situacao, erro = NULL,"
+                " atualizado_em = excluded.atualizado_em",
+                (os.path.abspath(caminho_pdf), *identificacao, datetime.now().isoformat(timespec="seconds"))
+            )
+
+    def concluir(self, caminho_pdf, hash_pdf, saidas):
+        """
+        Registra as saídas do PDF (caminhos absolutos) e a assinatura do processamento.
+        As saídas de um processamento anterior do mesmo arquivo com o mesmo conteúdo são
+        removidas, para que reprocessá-lo não deixe arquivos duplicados; as de outro
+        conteúdo com o mesmo nome são mantidas.
+        """
+        chave = (os.path.abspath(caminho_pdf), hash_pdf)
+        saidas = {tipo: os.path.abspath(saida) for tipo, saida in saidas.items() if saida}
+        with self._conectar() as conexao:
+            anterior = conexao.execute("SELECT excel, txt FROM documentos WHERE caminho = ? AND hash = ?",
+                                       chave).fetchone()
+            conexao.execute(
+                "UPDATE documentos SET situacao = 'concluido', excel = ?, txt = ?, consolidado = ?, erro = NULL,"
+                " assinatura = ?, atualizado_em = ? WHERE caminho = ? AND hash = ?",
+                (saidas["excel"], saidas["txt"], saidas.get("consolidado"), assinatura_processamento(),
+                 datetime.now().isoformat(timespec="seconds"), *chave)
+            )
+        for saida in anterior or ():
+            if saida and os.path.abspath(saida) not in saidas.values() and os.path.exists(saida):
+                os.remove(saida)
+
+    def falhar(self, caminho_pdf, hash_pdf, erro):
+        with self._conectar() as conexao:
+            conexao.execute(
+                "UPDATE documentos SET situacao = 'falha', erro = ?, atualizado_em = ? WHERE caminho = ? AND hash = ?",
+                (str(erro), datetime.now().isoformat(timespec="seconds"), os.path.abspath(caminho_pdf), hash_pdf)
+            )
+
+def processar_pdf(caminho_pdf, diretorio_saida, progresso=None, cancelamento=None, workers=None,
+                  manifesto=None, saidas=None):
+    """
+    Executa o fluxo completo de um PDF: OCR, mapeamento e exportação para Excel e TXT.
+    Retorna o DataFrame processado (vazio se a extração falhar). Com `manifesto`, um PDF
+    já concluído e sem alterações não é processado de novo e o retorno é None.
+    Se `saidas` (dicionário) for informado, recebe os caminhos dos arquivos gerados.
+    """
+    saidas = {} if saidas is None else saidas
+    if manifesto is not None:
+        identificacao, concluido = manifesto.verificar(caminho_pdf)
+        if concluido is not None:
+            logging.info(f"{caminho_pdf}: já processado, sem alterações ({concluido['excel']}).")
+            saidas.update((tipo, concluido[tipo]) for tipo in tipos_saida())
+            return None
+        manifesto.iniciar(caminho_pdf, identificacao)
+
+    status = "erro"
+    try:
+        df = extrair_dados_ocr(caminho_pdf, workers=workers, progresso=progresso, cancelamento=cancelamento)
+        df = exportar_pdf(df, caminho_pdf, diretorio_saida, saidas)
+        status = "vazio" if df.empty else "ok"
+        return df
+    except ProcessamentoCancelado:
+        status = "cancelado"
+        raise
+    finally:
+        finalizar_metricas(caminho_pdf, status)
+        if manifesto is not None:
+            registrar_no_manifesto(manifesto, caminho_pdf, identificacao[0], status, saidas)
+
+def registrar_no_manifesto(manifesto, caminho_pdf, hash_pdf, status, saidas):
+    """
+    Registra no manifesto o resultado do processamento de um PDF. Um PDF cancelado
+    continua como pendente, para ser retomado no próximo lote.
+    """
+    if status == "cancelado":
+        return
+    if status == "ok" and saidas_completas(saidas):
+        manifesto.concluir(caminho_pdf, hash_pdf, saidas)
+    else:
+        manifesto.falhar(caminho_pdf, hash_pdf, "saídas não geradas" if status == "ok" else status)
+
+def exportar_pdf(df, caminho_pdf, diretorio_saida, saidas=None):
+    """
+    Completa o mapeamento dos dados extraídos de um PDF e salva o Excel e o TXT.
+    Os códigos de conta já vêm de extrair_dados_ocr (montar_dataframe), que consulta a
+    base uma única vez por documento; aqui são acrescentados os valores e o "Código".
+    Se `saidas` (dicionário) for informado, recebe os caminhos dos arquivos gerados.
+    """
+    if saidas is None:
+        saidas = {}
+    if df.empty:
+        return df
+
+    metricas = metricas_documento(caminho_pdf)
+    with metricas.etapa("mapeamento"):
+        df = formatar_valor(df)
+        df = adicionar_coluna_historico(df)  # Adiciona a coluna "Código"
+
+    with metricas.etapa("excel"):
+        saidas["excel"] = salvar_excel_formatado(df, caminho_pdf, diretorio_saida)  # Salva o Excel
+    with metricas.etapa("txt"):
+        saidas["txt"] = salvar_txt_formatado(df, caminho_pdf, diretorio_saida)      # Salva o TXT
+    if SAIDA_CONSOLIDADA:
+        with metricas.etapa("consolidado"):
+            saidas["consolidado"] = salvar_consolidado(df, caminho_pdf, diretorio_saida)
+    metricas.contar("lancamentos", len(df))
+    return df
+
+# Planilhas acima deste tamanho são processadas em modo streaming (memória limitada)
+LIMITE_EXCEL_STREAMING = 20 * 1024 * 1024
+LINHAS_BLOCO_EXCEL = 50_000
+
+# Cabeçalho inserido na linha 1 das planilhas processadas
+CABECALHO_EXCEL = ["Data", "Lançamento", "Valor"]
+
+def processar_arquivo_excel(arquivo_excel, progresso=None, cancelamento=None, streaming=None):
+    """
+    Processa os valores terminados em 'C' ou 'D' de uma planilha, insere um cabeçalho
+    correto na linha 1 e salva as alterações no próprio arquivo.
+    Sem `streaming` explícito, o modo é escolhido pelo tamanho do arquivo.
+    """
+    if streaming is None:
+        streaming = os.path.getsize(arquivo_excel) > LIMITE_EXCEL_STREAMING
+    if streaming:
+        return processar_arquivo_excel_streaming(arquivo_excel, progresso, cancelamento)
+
+    df = pd.read_excel(arquivo_excel, dtype=str, header=None)  # Carregar SEM definir cabeçalho
+
+    if RASTREAMENTO:
+        logging.debug(f"Primeiras linhas antes da modificação:\n{df.head()}")
+    if progresso is not None:
+        progresso(mensagem=f"Primeiras linhas antes: {df.head()}")
+
+    # 🔹 Criar um novo DataFrame para o cabeçalho
+    colunas_novas = pd.DataFrame([CABECALHO_EXCEL])
+
+    # 🔹 Concatenar o cabeçalho com os dados originais, deslocando tudo para baixo
+    df = pd.concat([colunas_novas, df], ignore_index=True)
+
+    # Aplicar a formatação dos valores na planilha, uma coluna por vez
+    df = df.apply(converter_valores_cd)
+
+    # Salvar novamente o Excel
+    df.to_excel(arquivo_excel, index=False, header=False)  # Salva sem cabeçalho extra
+
+    logging.info(f"Arquivo Excel '{arquivo_excel}' processado e salvo.")
+
+def processar_arquivo_excel_streaming(arquivo_excel, progresso=None, cancelamento=None):
+    """
+    Mesmo processamento de processar_arquivo_excel, lendo a planilha em modo somente
+    leitura e gravando em modo somente escrita, LINHAS_BLOCO_EXCEL linhas por vez.
+    O resultado vai para um arquivo temporário que só substitui o original no final.
+    """
+    temporario = f"{os.path.splitext(arquivo_excel)[0]}.{os.getpid()}.tmp.xlsx"
+    origem = openpyxl.load_workbook(arquivo_excel, read_only=True, data_only=True)
+    try:
+        planilha = origem.worksheets[0]  # Como o pd.read_excel, apenas a primeira planilha
+        destino = openpyxl.Workbook(write_only=True)
+        saida = destino.create_sheet(title=planilha.title)
+        saida.append(CABECALHO_EXCEL)
+
+        def gravar_bloco(bloco):
+            if cancelamento is not None and cancelamento.is_set():
+                raise ProcessamentoCancelado(arquivo_excel)
+            df = pd.DataFrame(bloco, dtype=object).apply(converter_valores_cd)
+            for linha in linhas_planilha(df):
+                saida.append(linha)
+
+        total_linhas = 0
+        bloco = []
+        for linha in planilha.iter_rows(values_only=True):
+            # Os valores são lidos como texto, como no dtype=str do modo em memória
+            bloco.append([None if valor is None else str(valor) for valor in linha])
+            if len(bloco) >= LINHAS_BLOCO_EXCEL:
+                gravar_bloco(bloco)
+                total_linhas += len(bloco)
+                bloco = []
+        if bloco:
+            gravar_bloco(bloco)
+            total_linhas += len(bloco)
+
+        destino.save(temporario)
+    except BaseException:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+        raise
+    finally:
+        origem.close()
+
+    os.replace(temporario, arquivo_excel)
+    if progresso is not None:
+        progresso(mensagem=f"{total_linhas} linha(s) processada(s) em modo streaming.")
+    logging.info(f"Arquivo Excel '{arquivo_excel}' processado e salvo (streaming, {total_linhas} linhas).")
+
+class ExecutorLotes:
+    """
+    Executa tarefas de processamento em threads de fundo.
+    O andamento é publicado como eventos (dicionários) na fila thread-safe `eventos`,
+    que a interface consome sem bloquear. Novas tarefas podem ser enviadas a qualquer
+    momento e `cancelar` interrompe as tarefas pendentes e em execução.
+    """
+    def __init__(self, threads=2):
+        self.eventos = queue.Queue()
+        self._tarefas = queue.Queue()
+        self._threads = threads
+        self._iniciadas = []
+        self._cancelamentos = {}
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def enviar(self, descricao, funcao, *args, **kwargs):
+        """
+        Enfileira `funcao(*args, progresso=, cancelamento=, **kwargs)` e retorna o id da tarefa.
+        """
+        tarefa_id = next(self._ids)
+        cancelamento = threading.Event()
+        with self._lock:
+            self._cancelamentos[tarefa_id] = cancelamento
+            if len(self._iniciadas) < self._threads:
+                thread = threading.Thread(target=self._executar, daemon=True)
+                self._iniciadas.append(thread)
+                thread.start()
+        self.eventos.put({"tipo": "enfileirado", "tarefa": tarefa_id, "descricao": descricao})
+        self._tarefas.put((tarefa_id, descricao, funcao, args, kwargs, cancelamento))
+        return tarefa_id
+
+    def cancelar(self):
+        """
+        Cancela todas as tarefas pendentes e em execução.
+        """
+        with self._lock:
+            for cancelamento in self._cancelamentos.values():
+                cancelamento.set()
+
+    def pendentes(self):
+        """
+        Retorna quantas tarefas ainda não terminaram.
+        """
+        with self._lock:
+            return len(self._cancelamentos)
+
+    def _executar(self):
+        while True:
+            tarefa_id, descricao, funcao, args, kwargs, cancelamento = self._tarefas.get()
+            evento = {"tarefa": tarefa_id, "descricao": descricao}
+
+            def progresso(**dados):
+                self.eventos.put({"tipo": "progresso", **evento, **dados})
+
+            try:
+                if cancelamento.is_set():
+                    raise ProcessamentoCancelado(descricao)
+                self.eventos.put({"tipo": "inicio", **evento})
+                resultado = funcao(*args, progresso=progresso, cancelamento=cancelamento, **kwargs)
+                self.eventos.put({"tipo": "concluido", **evento, "resultado": resultado})
+            except ProcessamentoCancelado:
+                self.eventos.put({"tipo": "cancelado", **evento})
+            except Exception as e:
+                logging.error(f"Erro ao processar {descricao}: {e}")
+                self.eventos.put({"tipo": "erro", **evento, "erro": e})
+            finally:
+                with self._lock:
+                    del self._cancelamentos[tarefa_id]
+                    ocioso = not self._cancelamentos
+                if ocioso:
+                    self.eventos.put({"tipo": "ocioso"})
+
+def listar_pdfs(entradas):
+    """
+    Expande a lista de arquivos e diretórios informada nos PDFs a processar.
+    """
+    caminhos_pdf = []
+    for entrada in entradas:
+        if os.path.isdir(entrada):
+            for nome in sorted(os.listdir(entrada)):
+                caminho = os.path.join(entrada, nome)
+                if os.path.isfile(caminho) and nome.lower().endswith(".pdf"):
+                    caminhos_pdf.append(caminho)
+        else:
+            caminhos_pdf.append(entrada)
+    return caminhos_pdf
+
+def processar_lote(caminhos_pdf, diretorio_saida, workers=None, reprocessar=False):
+    """
+    Processa um lote de PDFs sem interface gráfica, com as páginas de todos os arquivos
+    no pool de OCR. Retorna a lista dos PDFs que falharam.
+    PDFs já concluídos e sem alterações segundo o manifesto do diretório de saída são
+    pulados (a menos que `reprocessar` seja verdadeiro), de modo que um lote interrompido
+    continua do primeiro arquivo não concluído.
+    Ao final grava o resumo das métricas do lote e o exibe no console.
+    """
+    os.makedirs(diretorio_saida, exist_ok=True)
+    manifesto = ManifestoLotes.do_diretorio(diretorio_saida)
+    falhas = []
+    pendentes = []
+    conteudos = {}  # hash -> primeiro PDF do lote com esse conteúdo
+    hashes = {}  # PDF pendente -> hash
+    for caminho_pdf in caminhos_pdf:
+        try:
+            identificacao, concluido = manifesto.verificar(caminho_pdf)
+        except OSError as e:
+            logging.error(f"Erro ao ler {caminho_pdf}: {e}")
+            print(f"Erro ao ler {caminho_pdf}: {e}")
+            falhas.append(caminho_pdf)
+            continue
+        if concluido is not None and not reprocessar:
+            print(f"Já processado, sem alterações: {caminho_pdf}")
+            continue
+        if identificacao[0] in conteudos:
+            print(f"Conteúdo idêntico a {conteudos[identificacao[0]]}, não será processado de novo: {caminho_pdf}")
+            continue
+        conteudos[identificacao[0]] = caminho_pdf
+        hashes[caminho_pdf] = identificacao[0]
+        manifesto.iniciar(caminho_pdf, identificacao)
+        pendentes.append(caminho_pdf)
+
+    registros = []
+    total = len(pendentes)
+    inicio = time.perf_counter()
+    resultados = extrair_dados_ocr_lote(pendentes, workers=workers) if pendentes else ()
+    for index, (caminho_pdf, df) in enumerate(resultados, start=1):
+        status = "erro"
+        saidas = {}
+        try:
+            df = exportar_pdf(df, caminho_pdf, diretorio_saida, saidas)
+            if df.empty:
+                status = "vazio"
+                print(f"[{index}/{total}] Falha ao processar arquivo: {caminho_pdf}")
+                falhas.append(caminho_pdf)
+            elif not saidas_completas(saidas):
+                print(f"[{index}/{total}] Falha ao salvar as saídas de: {caminho_pdf}")
+                falhas.append(caminho_pdf)
+            else:
+                status = "ok"
+                print(f"[{index}/{total}] Arquivo processado e salvo: {caminho_pdf}")
+        except Exception as e:
+            logging.error(f"Erro inesperado ao processar {caminho_pdf}: {e}")
+            print(f"[{index}/{total}] Erro inesperado ao processar {caminho_pdf}: {e}")
+            falhas.append(caminho_pdf)
+        registrar_no_manifesto(manifesto, caminho_pdf, hashes[caminho_pdf], status, saidas)
+        registro = finalizar_metricas(caminho_pdf, status)
+        if registro is not None:
+            registros.append(registro)
+
+    if not registros:
+        return falhas
+    resumo = resumir_metricas(registros, time.perf_counter() - inicio)
+    gravar_metricas(resumo)
+    logging.info(f"Resumo do lote: {resumo}")
+    print(formatar_resumo_metricas(resumo))
+    return falhas
+
+def formatar_resumo_metricas(resumo):
+    """
+    Monta o texto do resumo de métricas de um lote, com as etapas da mais demorada à mais rápida.
+    """
+    paginas = resumo["contadores"].get("paginas", 0)
+    linhas = [f"{resumo['documentos']} documento(s), {paginas} página(s) em {resumo['duracao_s']:.1f} s"
+              + (f" ({resumo['paginas_por_s']:.2f} páginas/s)" if resumo["paginas_por_s"] else "")]
+    for nome, segundos in sorted(resumo["etapas_s"].items(), key=lambda item: -item[1]):
+        linhas.append(f"  {nome:<18}{segundos:10.2f} s")
+    ignoradas = resumo["contadores"].get("linhas_ignoradas", 0)
+    aceitas = resumo["contadores"].get("linhas_aceitas", 0)
+    linhas.append(f"  linhas aceitas: {aceitas}, ignoradas: {ignoradas}")
+    if resumo["memoria_pico_mb"] is not None:
+        linhas.append(f"  maior pico de memória de uma etapa: {resumo['memoria_pico_mb']:.1f} MB")
+    return "\n".join(linhas)
+
+def vigiar_pasta(entrada, diretorio_saida, intervalo=5.0, workers=None):
+    """
+    Vigia a pasta de entrada e processa os PDFs novos assim que terminam de ser copiados.
+    Os arquivos processados vão para `processados/` e os que falharam para `falhas/`.
+    """
+    pasta_processados = os.path.join(entrada, "processados")
+    pasta_falhas = os.path.join(entrada, "falhas")
+    os.makedirs(pasta_processados, exist_ok=True)
+    os.makedirs(pasta_falhas, exist_ok=True)
+
+    tamanhos = {}  # caminho -> (tamanho, mtime) da última varredura
+    print(f"Vigiando {entrada} (Ctrl+C para encerrar)...")
+    while True:
+        prontos = []
+        atuais = {}
+        for caminho_pdf in listar_pdfs([entrada]):
+            try:
+                stat = os.stat(caminho_pdf)
+            except FileNotFoundError:
+                continue
+            atuais[caminho_pdf] = (stat.st_size, stat.st_mtime)
+            # Só processa o arquivo quando o tamanho parou de mudar entre duas varreduras
+            if tamanhos.get(caminho_pdf) == atuais[caminho_pdf]:
+                prontos.append(caminho_pdf)
+        tamanhos = atuais
+
+        if prontos:
+            falhas = set(processar_lote(prontos, diretorio_saida, workers=workers))
+            for caminho_pdf in prontos:
+                destino = os.path.join(pasta_falhas if caminho_pdf in falhas else pasta_processados,
+                                       os.path.basename(caminho_pdf))
+                if os.path.exists(destino):
+                    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+                    destino = os.path.join(os.path.dirname(destino), f"{timestamp}_{os.path.basename(destino)}")
+                shutil.move(caminho_pdf, destino)
+                tamanhos.pop(caminho_pdf, None)
+        else:
+            time.sleep(intervalo)
+
+# Fila de trabalhos compartilhada: tempo de posse (lease) de um PDF reivindicado por um
+# worker, renovado enquanto ele processa, e número máximo de tentativas por PDF
+DURACAO_LEASE = 300.0
+MAX_TENTATIVAS = 3
+
+class FilaTrabalhos:
+    """
+    Fila de PDFs em um arquivo SQLite, que pode ficar em uma pasta compartilhada para
+    que vários processos ou máquinas dividam o mesmo lote. Cada worker reivindica um PDF
+    por vez e recebe um lease; se o worker cair e o lease vencer, o PDF volta a ser
+    reivindicado por outro (até MAX_TENTATIVAS tentativas).
+    O SQLite fica no modo de journal padrão (sem WAL), que funciona em compartilhamentos de rede.
+    """
+    def __init__(self, caminho):
+        self.caminho = caminho
+        with self._conectar() as conexao:
+            conexao.execute(
+                "CREATE TABLE IF NOT EXISTS trabalhos ("
+                " id INTEGER PRIMARY KEY, caminho TEXT NOT NULL UNIQUE, diretorio_saida TEXT NOT NULL,"
+                " situacao TEXT NOT NULL DEFAULT 'pendente', tentativas INTEGER NOT NULL DEFAULT 0,"
+                " worker TEXT, lease_ate REAL, excel TEXT, txt TEXT, erro TEXT,"
+                " criado_em TEXT, atualizado_em TEXT)"
+            )
+            conexao.execute("CREATE INDEX IF NOT EXISTS trabalhos_situacao ON trabalhos (situacao, lease_ate)")
+
+    @contextlib.contextmanager
+    def _conectar(self):
+        # Sem transação implícita: cada bloco abre uma transação BEGIN IMMEDIATE, que trava a
+        # escrita antes da leitura e impede que dois workers reivindiquem o mesmo PDF
+        conexao = sqlite3.connect(self.caminho, timeout=60, isolation_level=None)
+        try:
+            conexao.execute("BEGIN IMMEDIATE")
+            try:
+                yield conexao
+            except BaseException:
+                conexao.execute("ROLLBACK")
+                raise
+            conexao.execute("COMMIT")
+        finally:
+            conexao.close()
+
+    def enfileirar(self, caminhos_pdf, diretorio_saida):
+        """
+        Acrescenta os PDFs à fila. PDFs já presentes são mantidos como estão.
+        Retorna quantos foram acrescentados.
+        """
+        agora = datetime.now().isoformat(timespec="seconds")
+        with self._conectar() as conexao:
+            antes = conexao.total_changes
+            conexao.executemany(
+                "INSERT OR IGNORE INTO trabalhos (caminho, diretorio_saida, criado_em, atualizado_em)"
+                " VALUES (?, ?, ?, ?)",
+                [(os.path.abspath(caminho_pdf), os.path.abspath(diretorio_saida), agora, agora)
+                 for caminho_pdf in caminhos_pdf]
+            )
+            return conexao.total_changes - antes
+
+    def reivindicar(self, worker, duracao=None):
+        """
+        Reivindica o próximo PDF pendente (ou cujo lease venceu) para o worker.
+        Retorna o trabalho como dicionário, ou None se não houver nada a fazer.
+        """
+        agora = time.time()
+        with self._conectar() as conexao:
+            # Leases vencidos de PDFs que já esgotaram as tentativas viram falha
+            conexao.execute(
+                "UPDATE trabalhos SET situacao = 'falha', erro = 'lease vencido', worker = NULL,"
+                " atualizado_em = ? WHERE situacao = 'em_andamento' AND lease_ate < ? AND tentativas >= ?",
+                (datetime.now().isoformat(timespec="seconds"), agora, MAX_TENTATIVAS)
+            )
+            registro = conexao.execute(
+                "SELECT id, caminho, diretorio_saida, tentativas FROM trabalhos"
+                " WHERE situacao = 'pendente' OR (situacao = 'em_andamento' AND lease_ate < ?)"
+                " ORDER BY id LIMIT 1", (agora,)
+            ).fetchone()
+            if registro is None:
+                return None
+            conexao.execute(
+                "UPDATE trabalhos SET situacao = 'em_andamento', worker = ?, lease_ate = ?,"
+                " tentativas = tentativas + 1, atualizado_em = ? WHERE id = ?",
+                (worker, agora + (duracao or DURACAO_LEASE), datetime.now().isoformat(timespec="seconds"),
+                 registro[0])
+            )
+        return {"id": registro[0], "caminho": registro[1], "diretorio_saida": registro[2],
+                "tentativa": registro[3] + 1}
+
+    def renovar(self, trabalho_id, worker, duracao=None):
+        """
+        Estende o lease do trabalho. Retorna False se o worker não é mais o dono dele.
+        """
+        with self._conectar() as conexao:
+            cursor = conexao.execute(
+                "UPDATE trabalhos SET lease_ate = ? WHERE id = ? AND worker = ? AND situacao = 'em_andamento'",
+                (time.time() + (duracao or DURACAO_LEASE), trabalho_id, worker)
+            )
+            return cursor.rowcount == 1
+
+    def concluir(self, trabalho_id, worker, saidas):
+        with self._conectar() as conexao:
+            conexao.execute(
+                "UPDATE trabalhos SET situacao = 'concluido', excel = ?, txt = ?, erro = NULL, lease_ate = NULL,"
+                " atualizado_em = ? WHERE id = ? AND worker = ?",
+                (saidas.get("excel"), saidas.get("txt"), datetime.now().isoformat(timespec="seconds"),
+                 trabalho_id, worker)
+            )
+
+    def falhar(self, trabalho_id, worker, erro, definitivo=False):
+        """
+        Registra a falha; o PDF volta para a fila enquanto houver tentativas, a menos que
+        a falha seja `definitivo` (o mesmo resultado se repetiria em outra tentativa).
+        """
+        with self._conectar() as conexao:
+            conexao.execute(
+                "UPDATE trabalhos SET situacao = CASE WHEN tentativas < ? THEN 'pendente' ELSE 'falha' END,"
+                " erro = ?, worker = NULL, lease_ate = NULL, atualizado_em = ? WHERE id = ? AND worker = ?",
+                (1 if definitivo else MAX_TENTATIVAS, str(erro), datetime.now().isoformat(timespec="seconds"),
+                 trabalho_id, worker)
+            )
+
+    def devolver(self, trabalho_id, worker):
+        """
+        Devolve o trabalho à fila sem contar a tentativa (worker encerrado pelo usuário).
+        """
+        with self._conectar() as conexao:
+            conexao.execute(
+                "UPDATE trabalhos SET situacao = 'pendente', tentativas = tentativas - 1, worker = NULL,"
+                " lease_ate = NULL WHERE id = ? AND worker = ?", (trabalho_id, worker)
+            )
+
+    def situacao(self):
+        """
+        Retorna a quantidade de PDFs em cada situação.
+        """
+        with self._conectar() as conexao:
+            return dict(conexao.execute("SELECT situacao, COUNT(*) FROM trabalhos GROUP BY situacao").fetchall())
+
+def executar_worker_fila(caminho_fila, workers=None, intervalo=5.0, ate_esvaziar=False):
+    """
+    Worker sem interface da fila compartilhada: reivindica um PDF por vez, processa com
+    processar_pdf (OCR local, usando o manifesto do diretório de saída) e registra o
+    resultado. Uma thread renova o lease enquanto o PDF é processado.
+    Com `ate_esvaziar`, encerra quando não houver mais PDFs disponíveis.
+    Retorna a quantidade de PDFs processados.
+    """
+    fila = FilaTrabalhos(caminho_fila)
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    processados = 0
+    print(f"Worker {worker} atendendo a fila {caminho_fila} (Ctrl+C para encerrar)...")
+    while True:
+        trabalho = fila.reivindicar(worker)
+        if trabalho is None:
+            if ate_esvaziar:
+                return processados
+            time.sleep(intervalo)
+            continue
+
+        caminho_pdf = trabalho["caminho"]
+        encerrado = threading.Event()
+
+        def renovar_lease():
+            while not encerrado.wait(DURACAO_LEASE / 3):
+                try:
+                    if not fila.renovar(trabalho["id"], worker):
+                        logging.warning(f"Lease de {caminho_pdf} perdido pelo worker {worker}.")
+                        return
+                except sqlite3.Error as e:
+                    logging.warning(f"Erro ao renovar o lease de {caminho_pdf}: {e}")
+
+        renovacao = threading.Thread(target=renovar_lease, daemon=True)
+        renovacao.start()
+        saidas = {}
+        try:
+            os.makedirs(trabalho["diretorio_saida"], exist_ok=True)
+            manifesto = ManifestoLotes.do_diretorio(trabalho["diretorio_saida"])
+            df = processar_pdf(caminho_pdf, trabalho["diretorio_saida"], workers=workers,
+                               manifesto=manifesto, saidas=saidas)
+            if df is not None and df.empty:
+                # Um extrato sem lançamentos reconhecidos daria o mesmo resultado de novo
+                fila.falhar(trabalho["id"], worker, "nenhum dado extraído", definitivo=True)
+                print(f"Falha ao processar arquivo (nenhum dado extraído): {caminho_pdf}")
+            elif df is not None and not saidas_completas(saidas):
+                fila.falhar(trabalho["id"], worker, "saídas não geradas")
+                print(f"Falha ao processar arquivo (tentativa {trabalho['tentativa']}): {caminho_pdf}")
+            else:
+                fila.concluir(trabalho["id"], worker, saidas)
+                processados += 1
+                print(f"Arquivo processado e salvo: {caminho_pdf}")
+        except KeyboardInterrupt:
+            fila.devolver(trabalho["id"], worker)
+            raise
+        except Exception as e:
+            logging.error(f"Erro inesperado ao processar {caminho_pdf}: {e}")
+            fila.falhar(trabalho["id"], worker, e)
+            print(f"Erro inesperado ao processar {caminho_pdf} (tentativa {trabalho['tentativa']}): {e}")
+        finally:
+            encerrado.set()
+            renovacao.join()
+
+def executar_cli(argv=None):
+    """
+    Ponto de entrada da linha de comando (sem interface gráfica).
+    """
+    global BASE_DADOS_PATH, ETAPAS_PREPROCESSAMENTO, MOTOR_OCR, METRICAS_PATH, RASTREAMENTO, LINHAS_IGNORADAS_DIR
+    global OCR_DPI_ADAPTATIVO, SAIDA_CONSOLIDADA, CORRESPONDENCIA_APROXIMADA, SIMILARIDADE_MINIMA
+    global USAR_CACHE_OCR, CACHE_OCR_DIR, MEDIR_MEMORIA
+    parser = argparse.ArgumentParser(prog="genesis", description="GÊNESIS - processamento de extratos em lote.")
+    parser.add_argument("--base", help="Caminho da BASE DE DADOS.xlsx")
+    parser.add_argument("--workers", type=int, default=None, help="Processos de OCR em paralelo")
+    parser.add_argument("--motor", choices=["auto", "tesserocr", "pytesseract"], default=None,
+                        help="Motor de OCR")
+    parser.add_argument("--preprocessamento", default=None,
+                        help="Etapas OpenCV antes do OCR, separadas por vírgula "
+                             f"({', '.join(ETAPAS_OPENCV)})")
+    parser.add_argument("--dpi-adaptativo", action="store_true",
+                        help="Lê as páginas em baixa resolução e repete em resolução maior só quando a "
+                             f"confiança do OCR é baixa ({', '.join(map(str, OCR_DPIS_ADAPTATIVOS))} DPI)")
+    parser.add_argument("--sem-cache", action="store_true", help="Não usa o cache de OCR em disco")
+    parser.add_argument("--cache-ocr", default=None, metavar="DIRETORIO",
+                        help=f"Diretório do cache de OCR ({CACHE_OCR_DIR})")
+    parser.add_argument("--aproximado", action="store_true",
+                        help="Mapeia por semelhança (trigramas) os históricos que não estão na base; "
+                             "as linhas ficam marcadas na coluna 'Correspondência'")
+    parser.add_argument("--similaridade-minima", type=float, default=None,
+                        help=f"Similaridade mínima, de 0 a 1, da correspondência aproximada ({SIMILARIDADE_MINIMA})")
+    parser.add_argument("--consolidado", action="store_true",
+                        help=f"Grava também os lançamentos de todos os PDFs em um conjunto Parquet "
+                             f"(<saída>/{DIRETORIO_CONSOLIDADO}/) com arquivo e página de origem")
+    parser.add_argument("--metricas", default=None,
+                        help="Arquivo JSON lines que recebe as métricas por documento e o resumo do lote")
+    parser.add_argument("--medir-memoria", action="store_true",
+                        help="Registra nas métricas o pico de memória de cada etapa (tracemalloc)")
+    parser.add_argument("--rastrear", action="store_true",
+                        help="Registra no log os dados intermediários de depuração")
+    parser.add_argument("--linhas-ignoradas", default=None, metavar="DIRETORIO",
+                        help="Grava neste diretório todas as linhas ignoradas de cada documento")
+    comandos = parser.add_subparsers(dest="comando", required=True)
+
+    cmd_processar = comandos.add_parser("processar", help="Processa arquivos PDF ou diretórios")
+    cmd_processar.add_argument("entradas", nargs="+", help="Arquivos PDF ou diretórios")
+    cmd_processar.add_argument("-o", "--saida", required=True, help="Diretório de saída")
+    cmd_processar.add_argument("--reprocessar", action="store_true",
+                               help="Processa de novo os PDFs já concluídos segundo o manifesto")
+
+    cmd_excel = comandos.add_parser("excel", help="Converte os valores C/D de planilhas Excel")
+    cmd_excel.add_argument("arquivos", nargs="+", help="Arquivos .xlsx (alterados no próprio arquivo)")
+    cmd_excel.add_argument("--streaming", action="store_true", default=None,
+                           help="Força o modo streaming (memória limitada)")
+
+    cmd_consolidar = comandos.add_parser("consolidar", help="Exporta o conjunto consolidado para um único .xlsx")
+    cmd_consolidar.add_argument("saida", help="Diretório de saída que contém o conjunto consolidado")
+    cmd_consolidar.add_argument("-o", "--arquivo", required=True, help="Arquivo .xlsx a gerar")
+
+    cmd_enfileirar = comandos.add_parser("enfileirar", help="Acrescenta PDFs a uma fila compartilhada")
+    cmd_enfileirar.add_argument("fila", help="Arquivo SQLite da fila (pode estar em uma pasta compartilhada)")
+    cmd_enfileirar.add_argument("entradas", nargs="+", help="Arquivos PDF ou diretórios")
+    cmd_enfileirar.add_argument("-o", "--saida", required=True, help="Diretório de saída")
+
+    cmd_trabalhar = comandos.add_parser("trabalhar", help="Processa PDFs de uma fila compartilhada")
+    cmd_trabalhar.add_argument("fila", help="Arquivo SQLite da fila")
+    cmd_trabalhar.add_argument("--intervalo", type=float, default=5.0, help="Segundos entre consultas à fila vazia")
+    cmd_trabalhar.add_argument("--ate-esvaziar", action="store_true", help="Encerra quando a fila esvaziar")
+
+    cmd_situacao = comandos.add_parser("situacao", help="Mostra a situação de uma fila compartilhada")
+    cmd_situacao.add_argument("fila", help="Arquivo SQLite da fila")
+
+    cmd_vigiar = comandos.add_parser("vigiar", help="Vigia uma pasta e processa os PDFs que chegarem")
+    cmd_vigiar.add_argument("entrada", help="Pasta de entrada")
+    cmd_vigiar.add_argument("-o", "--saida", required=True, help="Diretório de saída")
+    cmd_vigiar.add_argument("--intervalo", type=float, default=5.0, help="Segundos entre varreduras")
+
+    args = parser.parse_args(argv)
+
+    if args.aproximado:
+        CORRESPONDENCIA_APROXIMADA = True
+    if args.similaridade_minima is not None:
+        if not 0 < args.similaridade_minima <= 1:
+            parser.error("--similaridade-minima deve estar entre 0 e 1")
+        SIMILARIDADE_MINIMA = args.similaridade_minima
+    if args.dpi_adaptativo:
+        OCR_DPI_ADAPTATIVO = True
+    if args.sem_cache:
+        USAR_CACHE_OCR = False
+    if args.cache_ocr:
+        CACHE_OCR_DIR = args.cache_ocr
+    if args.consolidado:
+        SAIDA_CONSOLIDADA = True
+    if args.linhas_ignoradas:
+        LINHAS_IGNORADAS_DIR = args.linhas_ignoradas
+    if args.metricas:
+        METRICAS_PATH = args.metricas
+    if args.medir_memoria:
+        MEDIR_MEMORIA = True
+    if args.rastrear:
+        RASTREAMENTO = True
+    if args.base:
+        BASE_DADOS_PATH = args.base
+    if args.motor:
+        MOTOR_OCR = args.motor
+    if args.preprocessamento is not None:
+        etapas = tuple(etapa.strip() for etapa in args.preprocessamento.split(",") if etapa.strip())
+        desconhecidas = [etapa for etapa in etapas if etapa not in ETAPAS_OPENCV]
+        if desconhecidas:
+            parser.error(f"etapas de pré-processamento desconhecidas: {', '.join(desconhecidas)}")
+        ETAPAS_PREPROCESSAMENTO = etapas
+
+    configurar_logs()
+    validar_base_dados()
+
+    if os.name == "nt":
+        verificar_e_instalar_tesseract()
+        verificar_e_instalar_poppler()
+
+    try:
+        if args.comando == "processar":
+            caminhos_pdf = listar_pdfs(args.entradas)
+            if not caminhos_pdf:
+                print("Nenhum arquivo PDF encontrado.")
+                return 1
+            falhas = processar_lote(caminhos_pdf, args.saida, workers=args.workers, reprocessar=args.reprocessar)
+            print(f"{len(caminhos_pdf) - len(falhas)}/{len(caminhos_pdf)} arquivo(s) processado(s).")
+            return 1 if falhas else 0
+        if args.comando == "excel":
+            falhas = 0
+            for arquivo_excel in args.arquivos:
+                try:
+                    processar_arquivo_excel(arquivo_excel, streaming=args.streaming)
+                    print(f"Arquivo Excel '{arquivo_excel}' processado com sucesso!")
+                except Exception as e:
+                    logging.error(f"Erro ao processar Excel: {e}")
+                    print(f"Erro ao processar o arquivo {arquivo_excel}: {e}")
+                    falhas += 1
+            return 1 if falhas else 0
+        if args.comando == "enfileirar":
+            caminhos_pdf = listar_pdfs(args.entradas)
+            acrescentados = FilaTrabalhos(args.fila).enfileirar(caminhos_pdf, args.saida)
+            print(f"{acrescentados} de {len(caminhos_pdf)} arquivo(s) acrescentado(s) à fila.")
+            return 0
+        if args.comando == "trabalhar":
+            processados = executar_worker_fila(args.fila, workers=args.workers, intervalo=args.intervalo,
+                                               ate_esvaziar=args.ate_esvaziar)
+            print(f"{processados} arquivo(s) processado(s).")
+            return 0
+        if args.comando == "situacao":
+            for situacao, quantidade in sorted(FilaTrabalhos(args.fila).situacao().items()):
+                print(f"{situacao}: {quantidade}")
+            return 0
+        if args.comando == "consolidar":
+            try:
+                total = exportar_consolidado_excel(args.saida, args.arquivo)
+            except Exception as e:
+                logging.error(f"Erro ao exportar o conjunto consolidado: {e}")
+                print(f"Erro ao exportar o conjunto consolidado: {e}")
+                return 1
+            print(f"{total} lançamento(s) exportado(s) para {args.arquivo}.")
+            return 0
+        vigiar_pasta(args.entrada, args.saida, intervalo=args.intervalo, workers=args.workers)
+    except KeyboardInterrupt:
+        print("Interrompido.")
+        return 130
+    finally:
+        encerrar_pool_ocr()
+    return 0
+
 class AppInterface:
     """
     Interface gráfica do GÊNESIS.
@@ -334,6 +2732,16 @@ class AppInterface:
         self.root.title("GÊNESIS")
         self.root.geometry("800x700")
 
+        self.arquivos_pdf = ()
+        self.diretorio_saida = None
+
+        # Processamento em segundo plano; a interface só consome os eventos
+        self.executor = ExecutorLotes()
+        self.tarefas = {}  # tarefa -> (tipo, arquivo)
+        self.fracoes = {}  # tarefa -> fração concluída
+        self.tarefas_total = 0
+        self.tarefas_concluidas = 0
+
         # Configuração inicial do tema
         self.tema_atual = "dark"  # Define o tema inicial como escuro
         ctk.set_appearance_mode(self.tema_atual)
@@ -397,6 +2805,10 @@ class AppInterface:
         )
         self.btn_processar_excel.grid(row=1, column=1, padx=10, pady=5)
 
+        self.btn_cancelar = ctk.CTkButton(self.botoes_frame, text="Cancelar",
+                                          command=self.cancelar, corner_radius=10, width=180)
+        self.btn_cancelar.grid(row=1, column=2, padx=10, pady=5)
+
 
 
         # Botão para alternar temas
@@ -404,6 +2816,17 @@ class AppInterface:
                                       corner_radius=10, width=180)
         self.btn_tema.pack(pady=10)
 
+        self.progress_bar.set(0)
+        self.root.after(100, self.consumir_eventos)
+        self.root.protocol("WM_DELETE_WINDOW", self.fechar)
+
+    def fechar(self):
+        """
+        Cancela o processamento em andamento e fecha a janela.
+        """
+        self.executor.cancelar()
+        self.root.destroy()
+
     def alternar_tema(self):
         """
         Alterna entre os temas claro e escuro.
@@ -432,7 +2855,8 @@ class AppInterface:
 
     def processar_e_salvar(self):
         """
-        Processa e salva os arquivos PDF selecionados.
+        Envia os arquivos PDF selecionados para processamento em segundo plano.
+        Pode ser chamado novamente durante o processamento para enfileirar mais arquivos.
         """
         if not self.arquivos_pdf:
             messagebox.showwarning("Aviso", "Nenhum arquivo PDF foi selecionado.")
@@ -443,28 +2867,14 @@ class AppInterface:
 
         self.texto_status.insert("end", "Processando e salvando arquivos...\n")
         os.makedirs(self.diretorio_saida, exist_ok=True)
+        manifesto = ManifestoLotes.do_diretorio(self.diretorio_saida)
 
-        for index, caminho_pdf in enumerate(self.arquivos_pdf, start=1):
-            try:
-                df = extrair_dados_ocr(caminho_pdf)
-                if not df.empty:
-                    df = formatar_valor(df)
-                    df = adicionar_colunas_personalizadas(df)
-                    df = adicionar_coluna_historico(df)  # Adiciona a coluna "Código"
-
-                    salvar_excel_formatado(df, caminho_pdf, self.diretorio_saida)  # Salva o Excel
-                    salvar_txt_formatado(df, caminho_pdf, self.diretorio_saida)    # Salva o TXT
-
-                    self.texto_status.insert("end", f"Arquivo {index}/{len(self.arquivos_pdf)} processado e salvo.\n")
-                else:
-                    self.texto_status.insert("end", f"Falha ao processar arquivo: {caminho_pdf}\n")
-
-            except ValueError as e:
-                self.texto_status.insert("end", f"Erro: {e} ao processar o arquivo: {caminho_pdf}\n")
-            except Exception as e:
-                self.texto_status.insert("end", f"Erro inesperado ao processar {caminho_pdf}: {e}\n")
-
-        self.texto_status.insert("end", "Todos os arquivos foram processados e salvos no diretório selecionado.\n")
+        for caminho_pdf in self.arquivos_pdf:
+            tarefa = self.executor.enviar(caminho_pdf, processar_pdf, caminho_pdf, self.diretorio_saida,
+                                          manifesto=manifesto)
+            self.tarefas[tarefa] = ("pdf", caminho_pdf)
+            self.tarefas_total += 1
+        self.arquivos_pdf = ()
 
     def processar_excel(self):
         """
@@ -477,41 +2887,97 @@ class AppInterface:
             messagebox.showwarning("Aviso", "Nenhum arquivo Excel foi selecionado.")
             return
 
-        try:
-            df = pd.read_excel(arquivo_excel, dtype=str, header=None)  # Carregar SEM definir cabeçalho
-
-            print("Primeiras linhas antes da modificação:\n", df.head())  # Depuração
-            self.texto_status.insert("end", f"Primeiras linhas antes: {df.head()}\n")
-
-            # 🔹 Criar um novo DataFrame para o cabeçalho
-            colunas_novas = pd.DataFrame([["Data", "Lançamento", "Valor"]])
+        tarefa = self.executor.enviar(arquivo_excel, processar_arquivo_excel, arquivo_excel)
+        self.tarefas[tarefa] = ("excel", arquivo_excel)
+        self.tarefas_total += 1
 
-            # 🔹 Concatenar o cabeçalho com os dados originais, deslocando tudo para baixo
-            df = pd.concat([colunas_novas, df], ignore_index=True)
+    def cancelar(self):
+        """
+        Cancela o lote em andamento e os arquivos ainda na fila.
+        """
+        if self.executor.pendentes():
+            self.executor.cancelar()
+            self.texto_status.insert("end", "Cancelando o processamento...\n")
 
-            # Aplicar a formatação dos valores na planilha
-            df = df.applymap(ajustar_valor)
+    def consumir_eventos(self):
+        """
+        Atualiza o status e a barra de progresso com os eventos do executor (thread da interface).
+        """
+        try:
+            while True:
+                self.tratar_evento(self.executor.eventos.get_nowait())
+        except queue.Empty:
+            pass
+
+        if self.tarefas_total:
+            andamento = self.tarefas_concluidas + sum(self.fracoes.values())
+            self.progress_bar.set(andamento / self.tarefas_total)
+        self.root.after(100, self.consumir_eventos)
+
+    def tratar_evento(self, evento):
+        tipo = evento["tipo"]
+        if tipo == "ocioso":
+            if self.tarefas:
+                return  # Arquivos enfileirados depois que o executor ficou ocioso
+            if self.tarefas_total:
+                self.texto_status.insert("end", "Todos os arquivos foram processados e salvos no diretório selecionado.\n")
+            self.tarefas_total = self.tarefas_concluidas = 0
+            self.fracoes.clear()
+            self.progress_bar.set(0)
+            return
 
-            # Salvar novamente o Excel
-            df.to_excel(arquivo_excel, index=False, header=False)  # Salva sem cabeçalho extra
+        tarefa = evento["tarefa"]
+        tipo_tarefa, arquivo = self.tarefas.get(tarefa, (None, evento["descricao"]))
+        if tipo == "progresso":
+            if "pagina" in evento:
+                self.fracoes[tarefa] = evento["pagina"] / evento["total"]
+            if "mensagem" in evento:
+                self.texto_status.insert("end", f"{evento['mensagem']}\n")
+            return
+        if tipo not in ("concluido", "erro", "cancelado"):
+            return
 
+        self.tarefas.pop(tarefa, None)
+        self.fracoes.pop(tarefa, None)
+        self.tarefas_concluidas += 1
+
+        if tipo == "cancelado":
+            self.texto_status.insert("end", f"Cancelado: {arquivo}\n")
+        elif tipo == "erro":
+            erro = evento["erro"]
+            if tipo_tarefa == "excel":
+                messagebox.showerror("Erro", f"Erro ao processar o arquivo: {erro}")
+            elif isinstance(erro, ValueError):
+                self.texto_status.insert("end", f"Erro: {erro} ao processar o arquivo: {arquivo}\n")
+            else:
+                self.texto_status.insert("end", f"Erro inesperado ao processar {arquivo}: {erro}\n")
+        elif tipo_tarefa == "excel":
             messagebox.showinfo("Sucesso", "O arquivo Excel foi processado com sucesso!")
-
-            self.texto_status.insert("end", f"Arquivo Excel '{os.path.basename(arquivo_excel)}' processado com sucesso!\n")
-            logging.info(f"Arquivo Excel '{arquivo_excel}' processado e salvo.")
-
-        except Exception as e:
-            messagebox.showerror("Erro", f"Erro ao processar o arquivo: {e}")
-            logging.error(f"Erro ao processar Excel: {e}")
+            self.texto_status.insert("end", f"Arquivo Excel '{os.path.basename(arquivo)}' processado com sucesso!\n")
+        elif evento["resultado"] is None:
+            self.texto_status.insert("end", f"Já processado, sem alterações: {arquivo}\n")
+        elif evento["resultado"].empty:
+            self.texto_status.insert("end", f"Falha ao processar arquivo: {arquivo}\n")
+        else:
+            self.texto_status.insert("end", f"Arquivo {self.tarefas_concluidas}/{self.tarefas_total} processado e salvo.\n")
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # Necessário para o pool de OCR no executável do Windows
+    if len(sys.argv) > 1:
+        sys.exit(executar_cli())
+    configurar_logs()
+    validar_base_dados()
     try:
-        verificar_e_instalar_tesseract()
-        verificar_e_instalar_poppler()
-        print("Todas as dependências foram instaladas.")
+        # Fora do Windows o Tesseract e o Poppler vêm do PATH (instalados pelo sistema)
+        if os.name == "nt":
+            verificar_e_instalar_tesseract()
+            verificar_e_instalar_poppler()
+            print("Todas as dependências foram instaladas.")
 
         root = ctk.CTk()
         app = AppInterface(root)
         root.mainloop()
     except Exception as e:
         print(f"Erro ao configurar dependências: {e}")
+    finally:
+        encerrar_pool_ocr()